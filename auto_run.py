@@ -34,7 +34,7 @@ def run(game):
 
 if __name__ == '__main__':
     for puzzle in puzzles:
-        game = Game(get_xml_from_path(path_puzzles + '/' + puzzle))
+        game = Game(get_xml_from_path(path_puzzles + '/' + puzzle), cache_domains=True)
 
         with open(path_results + '/' + puzzle[:-4] + '_ml_time.csv', 'w') as report_time:
             with open(path_results + '/' + puzzle[:-4] + '_ml_turns.csv', 'w') as report_turns:
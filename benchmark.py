@@ -0,0 +1,66 @@
+import os
+from time import time
+
+from board import generate_matrix_from_xml_dict, Board
+from paths import find_walks, remove_duplicate_footprints
+from xml_parser import get_xml_from_path
+
+path_puzzles = './boards'
+NUMBER_OF_HEADS = 10  # How many of the largest numbers to benchmark
+
+
+def remove_duplicate_footprints_pairwise(paths):
+    """
+    The old footprint deduplication (compares every pair of paths), kept as a reference for the benchmark
+    """
+    paths_mask = [True for i in range(len(paths))]
+    for i, path_A in enumerate(paths):
+        for j, path_B in enumerate(paths[i + 1:], start=(i + 1)):
+            if paths_mask[j] is True and len(path_A) == len(path_B) and set(path_A) == set(path_B):
+                paths_mask[i] = False
+                paths_mask[j] = False
+
+    return [path for i, path in enumerate(paths) if paths_mask[i]]
+
+
+def get_largest_head_pairs(puzzles):
+    """
+    :return: List of (number, puzzle, board, start, end) of the largest numbers in the puzzles, largest first
+    """
+    pairs = []
+    for puzzle in puzzles:
+        xml_dict = get_xml_from_path(path_puzzles + '/' + puzzle)
+        numbers_matrix, coloring_matrix = generate_matrix_from_xml_dict(xml_dict)
+        board = Board(len(xml_dict['colors']), numbers_matrix)
+        for paths in xml_dict['paths'].values():
+            for path in paths:
+                pairs += [(len(path), puzzle, board, path[0], path[-1])]
+
+    pairs.sort(key=lambda pair: pair[0], reverse=True)
+    return pairs
+
+
+def benchmark_footprint_dedup(puzzles):
+    """
+    Compare the pairwise footprint deduplication with the hash based one, on the largest numbers in the puzzles
+    """
+    print('number, puzzle, paths, unique paths, pairwise time, hash time, speedup')
+    for number, puzzle, board, start, end in get_largest_head_pairs(puzzles)[:NUMBER_OF_HEADS]:
+        paths = find_walks(board.get_width(), board.get_height(), board.numbered_cells_flags, start, end, number)
+
+        start_time = time()
+        pairwise_paths = remove_duplicate_footprints_pairwise(paths)
+        pairwise_time = time() - start_time
+
+        start_time = time()
+        hash_paths = remove_duplicate_footprints(paths)
+        hash_time = time() - start_time
+
+        assert pairwise_paths == hash_paths
+        print(f'{number}, {puzzle}, {len(paths)}, {len(hash_paths)}, {pairwise_time:.4f}, {hash_time:.4f}, '
+              f'{pairwise_time / max(hash_time, 1e-6):.1f}x')
+
+
+if __name__ == '__main__':
+    puzzles = [f for f in os.listdir(path_puzzles) if f != 'very_big_color.xml']
+    benchmark_footprint_dedup(puzzles)
@@ -1,6 +1,17 @@
 import copy
+import multiprocessing
+import os
+import random
+from functools import lru_cache
 
-from util import manhattan_distance
+import numpy as np
+
+from domains import DomainIndex, DomainStore, HeadDomain, get_cached_domain_store, get_domains_key
+from paths import find_distance_field, find_walks, find_walks_bidirectional, find_walks_from_shapes, \
+    remove_duplicate_footprints, BIDIRECTIONAL_MIN_LENGTH, SHAPE_LIBRARY_MAX_LENGTH, UNREACHABLE
+
+LAZY_DOMAIN_MIN_LENGTH = 16  # Default number from which heads search their moves on the board (see set_lazy_domains)
+ZOBRIST_SEED = 0  # Same seed for all the boards, so boards of the same size get the same keys for the same coloring
 
 
 def generate_matrix_from_xml_dict(xml_dict):
@@ -29,18 +40,48 @@ def generate_matrix_from_xml_dict(xml_dict):
     return numbers_matrix, coloring_matrix
 
 
-class Board:
+# The board of a worker process of Board.precompute_domains
+worker_board = None
+
+
+def init_domains_worker(board):
     """
-    A Board describes the current state of the game board. It's separate from
-    the game engine to allow the Input objects to check if their moves are valid,
-    etc... without the help of the game engine.
+    Initializer of the worker processes of Board.precompute_domains, keeps the board the paths are searched on.
+    """
+    global worker_board
+    worker_board = board
 
-    The Board stores:
-    - board_w/board_h: the width and height of the playing area
-    - state: a matrix (2D list) of cells
-    - matrix: a matrix (2D list) of [(number, number_color), cell_color]
-    - colors: the number of the colors
+
+def find_pair_paths_worker(pair):
+    """
+    Find the paths between a pair of heads on the board of the worker process (see Board.get_pair_paths).
+    :param pair: ((x, y), (end_x, end_y)), the head that comes first (top to bottom) first
+    :return: (pair, list of paths)
+    """
+    (x, y), (end_x, end_y) = pair
+    return pair, worker_board.get_paths(x, y, end_x, end_y, worker_board.get_number_in_cell(x, y))
+
+
+@lru_cache(maxsize=None)
+def get_zobrist_table(size, num_of_colors):
+    """
+    Random 64-bit keys for coloring each cell in each color. The key of a coloring is the XOR of the keys of its
+    colored cells (color 0, an empty cell, has key 0).
+    :param size: The number of cells in the board (board_w * board_h)
+    :return: Tuple of tuples, table[x * board_w + y][cell_color] is the key of coloring the cell (x, y)
     """
+    generator = random.Random(ZOBRIST_SEED)
+    return tuple((0,) + tuple(generator.getrandbits(64) for color in range(num_of_colors)) for cell in range(size))
+
+
+class BaseBoard:
+    """
+    The logic shared by all the Board backends: the getters and setters of the cells, the paths search and the
+    domains. It stores nothing itself (see Board and CompactBoard for the storage), and has empty __slots__, so
+    backends with __slots__ have no __dict__.
+    """
+
+    __slots__ = ()
 
     def __init__(self, num_of_colors, numbers_matrix, coloring_matrix=None):
         self.num_of_colors = num_of_colors
@@ -54,6 +95,45 @@ class Board:
         self.possible_paths = [[None for i in range(self.get_width())] for j in range(self.get_height())]
         self.numbered_cells = [(i, j) for i in range(self.get_height()) for j in range(self.get_width())
                                if self.is_numbered_cell(i, j)]
+        self.numbered_cells_flags = bytearray(self.get_height() * self.get_width())
+        for i, j in self.numbered_cells:
+            self.numbered_cells_flags[i * self.get_width() + j] = 1
+
+        # Heads grouped by their (number, number_color)
+        self.heads_by_clue = {}
+        for i, j in self.numbered_cells:
+            clue = (self.get_number_in_cell(i, j), self.get_number_color_in_cell(i, j))
+            self.heads_by_clue.setdefault(clue, []).append((i, j))
+
+        # Distance fields of the heads (see get_distance_field)
+        self.distance_fields = {}
+
+        # Paths of this length or longer are searched from both ends (see get_paths)
+        self.bidirectional_min_length = BIDIRECTIONAL_MIN_LENGTH
+
+        # Paths between pairs of heads, shared by both heads of the pair (see get_pair_paths). Cleared once the
+        # possible paths of all the heads are kept elsewhere (see compact_domains and precompute_domains)
+        self.pair_paths = {}
+
+        # Last valid path found for each head, shared between copies (see has_any_move)
+        self.move_witnesses = {}
+
+        # Zobrist key of the coloring, updated with every change of a cell (see get_zobrist_table)
+        self.zobrist_table = get_zobrist_table(self.get_height() * self.get_width(), self.num_of_colors)
+        self.zobrist_key = 0
+        for i in range(self.get_height()):
+            for j in range(self.get_width()):
+                self.zobrist_key ^= self.zobrist_table[i * self.get_width() + j][self.get_cell_coloring(i, j)]
+
+        # Paths colored in place and the old colors of their cells, newest last (see apply_path)
+        self.trail = []
+
+        # Filled only when used (see compact_domains and build_domain_index)
+        self.domain_store = None
+        self.domain_index = None
+
+        # Heads with this number or more search their moves on the board (see set_lazy_domains), None for no lazy heads
+        self.lazy_domain_min_length = None
 
     def __str__(self):
         out_str = []
@@ -64,17 +144,25 @@ class Board:
         return ''.join(out_str)
 
     def __eq__(self, other):
-        return self.coloring_matrix == other.coloring_matrix
+        # Full compare only if the keys are equal
+        return self.zobrist_key == other.zobrist_key and self.coloring_matrix == other.coloring_matrix
 
     def __hash__(self):
-        return hash(str(self.numbers_matrix) + str(self.coloring_matrix))
+        return self.zobrist_key
 
-    def __copy__(self):
-        cpy_board = self.__new__(self.__class__)  # Create empty object
-        cpy_board.__dict__.update(self.__dict__)  # Shallow copy everything
-        cpy_board.coloring_matrix = copy.deepcopy(self.coloring_matrix)  # Deep copy only the coloring matrix
+    def get_successor(self, path, cell_color):
+        """
+        The board after coloring the path, without changing this board. The successor copies only the rows of the
+        coloring matrix that the path covers, and shares the rest with this board, so the frontier searches can keep
+        many boards without a full matrix for each one.
+        :param path: List of cells (x, y)
+        :param cell_color: Color indicator
+        :return: New board
+        """
+        successor = self.get_shared_copy({x for x, _ in path})
+        successor.set_cells_coloring(path, cell_color)
 
-        return cpy_board
+        return successor
 
     # *** Boolean Getters *** #
     def is_numbered_cell(self, x, y):
@@ -89,6 +177,29 @@ class Board:
         """
         return self.get_cell_coloring(x, y) != 0
 
+    def is_head_pair(self, x, y, end_x, end_y, length):
+        """
+        :return: True if (end_x, end_y) is on the board and has the same number (length) and number color as (x, y),
+                 else False
+        """
+        return 0 <= end_x < self.get_height() and 0 <= end_y < self.get_width() \
+            and self.get_number_in_cell(end_x, end_y) == length \
+            and self.get_number_color_in_cell(x, y) == self.get_number_color_in_cell(end_x, end_y)
+
+    def is_lazy_head(self, x, y):
+        """
+        :return: True if the moves of the head (x, y) are searched on the current board, else False
+        """
+        return self.lazy_domain_min_length is not None \
+            and self.get_number_in_cell(x, y) >= self.lazy_domain_min_length
+
+    def uses_domain_index(self, x, y):
+        """
+        :return: True if the moves of the head (x, y) are taken from the domain index, else False. The index is used
+                 only by the board whose coloring it matches.
+        """
+        return self.domain_index is not None and self.domain_index.board is self and self.domain_index.is_indexed(x, y)
+
     def is_valid_path(self, path):
         """
         :param path: The path we want to check
@@ -140,11 +251,45 @@ class Board:
     def get_number_of_colors(self):
         return self.num_of_colors
 
+    def get_distance_field(self, x, y):
+        """
+        Distance of every cell from the head (x, y), when other heads are walls (see paths.find_distance_field).
+        Only distances up to the head's number are searched, since no path of this head can be longer.
+        :return: bytearray (size board_w * board_h), cell (x, y) is x * board_w + y. UNREACHABLE for farther cells.
+        """
+        if (x, y) not in self.distance_fields:
+            self.distance_fields[(x, y)] = find_distance_field(self.get_width(), self.get_height(),
+                                                               self.numbered_cells_flags, (x, y),
+                                                               self.get_number_in_cell(x, y) - 1)
+        return self.distance_fields[(x, y)]
+
+    def get_distance(self, x, y, end_x, end_y):
+        """
+        :return: The number of steps needed to get from the cell (x, y) to the head (end_x, end_y) without passing
+                 through other heads. None if it is farther than the head's number (or can't be reached).
+        """
+        distance = self.get_distance_field(end_x, end_y)[x * self.get_width() + y]
+        return None if distance == UNREACHABLE else distance
+
+    def get_occupancy_array(self):
+        """
+        :return: Flat boolean array (size board_w * board_h), True for colored cells. Cell (x, y) is x * board_w + y
+        """
+        return np.array(self.coloring_matrix, dtype=bool).ravel()
+
+    def get_walls(self):
+        """
+        :return: bytes (size board_w * board_h), non-zero for the cells a new path can't pass through (numbered cells
+                 and colored cells). Cell (x, y) is x * board_w + y
+        """
+        return (self.get_occupancy_array() | np.frombuffer(self.numbered_cells_flags, dtype=bool)).tobytes()
+
     # *** Setters *** #
     def set_cell_coloring(self, x, y, cell_color):
         """
         The function colors the cell (x, y) in the given color
         """
+        self.update_zobrist_key(x, y, cell_color)
         self.coloring_matrix[x][y] = cell_color
 
     def set_cells_coloring(self, cells, cell_color):
@@ -154,76 +299,308 @@ class Board:
         :param cell_color: Color indicator
         """
         for cell in cells:
+            self.update_zobrist_key(cell[0], cell[1], cell_color)
             self.coloring_matrix[cell[0]][cell[1]] = cell_color
 
+    def update_zobrist_key(self, x, y, cell_color):
+        """
+        Update the Zobrist key for coloring the cell (x, y) in the given color. Call before changing the cell.
+        """
+        keys = self.zobrist_table[x * self.get_width() + y]
+        self.zobrist_key ^= keys[self.coloring_matrix[x][y]] ^ keys[cell_color]
+
+    def apply_path(self, path, cell_color):
+        """
+        Color the path in place, and push it with the old colors of its cells to the trail, so undo_path can
+        restore them. Keeps the domain index up to date if it follows this board.
+        :param path: List of cells (x, y)
+        :param cell_color: Color indicator
+        """
+        self.trail.append((path, [self.get_cell_coloring(x, y) for x, y in path]))
+        self.set_cells_coloring(path, cell_color)
+
+        if self.domain_index is not None and self.domain_index.board is self:
+            self.domain_index.apply(path, self)
+
+    def undo_path(self):
+        """
+        Undo the last apply_path: pop it from the trail and restore the old colors of its cells.
+        :return: The path that was undone
+        """
+        path, colors = self.trail.pop()
+        if self.domain_index is not None and self.domain_index.board is self:
+            self.domain_index.undo(path, self)
+
+        if any(colors):
+            for (x, y), color in zip(path, colors):
+                self.set_cell_coloring(x, y, color)
+        else:
+            self.set_cells_coloring(path, 0)
+
+        return path
+
+    def set_lazy_domains(self, min_length=LAZY_DOMAIN_MIN_LENGTH):
+        """
+        Heads with a number of at least min_length will not keep all their possible paths. Instead, their moves are
+        searched on the current board every time (see find_possible_moves), so the cost is only of the paths that
+        are still valid. The number of possible paths grows exponentially with the number, so these are the heads
+        with the biggest domains.
+        The threshold is on the number of the head and not on the size of its domain: the size is known only after
+        the domain is found, and not finding the big domains is the point of lazy heads.
+        :param min_length: The smallest number of a lazy head, None to turn off.
+        """
+        self.lazy_domain_min_length = min_length
+
     def get_possible_moves(self, x, y):
         """
         :return: All valid paths from the head (x, y) to another head
         """
-        ret = []
-        paths = self.get_possible_paths(x, y)
+        if self.is_lazy_head(x, y):
+            return self.find_possible_moves(x, y)
+
+        if self.uses_domain_index(x, y):
+            return self.domain_index.get_moves(x, y)
+
+        if self.domain_store is not None:
+            return self.domain_store.get_domain(x, y).filter_valid(self.get_occupancy_array())
+
+        # Check the stored paths, only the valid paths are reversed (see HeadDomain.filter_paths)
+        return self.get_possible_paths(x, y).filter_paths(self.is_valid_path)
+
+    def has_any_move(self, x, y):
+        """
+        Check if the head (x, y) has at least one valid path, without finding all of them.
+        The first valid path found (the witness) is remembered, and checked first next time.
+        :return: True if the head has a valid path, else False
+        """
+        if self.uses_domain_index(x, y):
+            return self.domain_index.count_moves(x, y) > 0
+
+        witness = self.move_witnesses.get((x, y))
+        if witness is not None and self.is_valid_path(witness):
+            return True
+
+        if self.is_lazy_head(x, y) or self.domain_store is not None:
+            paths = self.get_possible_moves(x, y)
+        else:
+            paths = self.get_possible_paths(x, y)
+            paths = paths.iter_selected(self.is_valid_path(path) for path in paths.iter_stored())
+
         for path in paths:
+            self.move_witnesses[(x, y)] = path
+            return True
+        return False
+
+    def count_moves(self, x, y, limit=None):
+        """
+        Count the valid paths from the head (x, y), without building the list of them.
+        :param limit: Stop counting when getting to limit, None to count all the paths.
+        :return: The number of valid paths (at most limit)
+        """
+        if self.uses_domain_index(x, y):
+            count = self.domain_index.count_moves(x, y)
+            return count if limit is None else min(count, limit)
+
+        if self.is_lazy_head(x, y) or self.domain_store is not None:
+            count = len(self.get_possible_moves(x, y))
+            return count if limit is None else min(count, limit)
+
+        count = 0
+        for path in self.get_possible_paths(x, y).iter_stored():
             if self.is_valid_path(path):
-                ret += [path]
-                continue
-        return ret
+                count += 1
+                if count == limit:
+                    break
+        return count
 
     # *** Possible Paths Finder *** #
+    def compact_domains(self, use_cache=False):
+        """
+        Move the possible paths of all the heads into a compact DomainStore (see domains.py).
+        From now on get_possible_paths and get_possible_moves return DomainViews of the store.
+        :param use_cache: If True, load the store from the domains cache on disk (see get_cached_domain_store)
+        """
+        if self.domain_store is None:
+            self.domain_store = get_cached_domain_store(self) if use_cache else DomainStore.from_board(self)
+            self.possible_paths = [[None for i in range(self.get_width())] for j in range(self.get_height())]
+            self.pair_paths.clear()
+
+    def share_domains(self):
+        """
+        Publish the compact domains of the board in shared memory (see DomainStore.share), so worker processes can
+        attach them with attach_domains instead of finding or pickling them. Call domain_store.release() when the
+        workers are done.
+        :return: Picklable descriptor of the shared domains
+        """
+        self.compact_domains()
+        return self.domain_store.share(get_domains_key(self))
+
+    def attach_domains(self, descriptor):
+        """
+        Use domains shared by another process (see share_domains) as the compact domains of this board, without
+        copying them. The board must have the same heads and clues as the board that shared them.
+        :param descriptor: The descriptor returned by share_domains
+        """
+        self.domain_store = DomainStore.attach(descriptor, get_domains_key(self))
+        self.possible_paths = [[None for i in range(self.get_width())] for j in range(self.get_height())]
+
+    def precompute_domains(self, workers=None):
+        """
+        Find the possible paths of all the heads before the search starts, instead of lazily on first use.
+        Each pair of heads is a task for a pool of worker processes. The most expensive pairs (by estimate_pair_cost)
+        are sent first, so the workers finish at about the same time. The paths are merged into the pair cache and
+        the possible paths of the heads, so compact_domains afterwards only packs them. The pair cache is cleared
+        afterwards, the possible paths of the heads keep the paths.
+        :param workers: Number of worker processes, None for the number of CPUs. 1 finds the paths in this process.
+        """
+        if self.domain_store is not None:
+            return
+
+        pairs = set()
+        for x, y in self.get_list_of_numbered_cells():
+            if self.possible_paths[x][y] is not None:
+                continue
+            for end_x, end_y in self.get_possible_ends(x, y):
+                pair = ((x, y), (end_x, end_y)) if (x, y) < (end_x, end_y) else ((end_x, end_y), (x, y))
+                if pair not in self.pair_paths:
+                    pairs.add(pair)
+        pairs = sorted(pairs, key=self.estimate_pair_cost, reverse=True)
+
+        if workers is None:
+            workers = os.cpu_count()
+        if workers > 1 and len(pairs) > 1:
+            with multiprocessing.Pool(min(workers, len(pairs)), init_domains_worker, (self,)) as pool:
+                for pair, paths in pool.imap_unordered(find_pair_paths_worker, pairs):
+                    self.pair_paths[pair] = paths
+
+        for x, y in self.get_list_of_numbered_cells():
+            self.get_possible_paths(x, y)
+        self.pair_paths.clear()
+
+    def estimate_pair_cost(self, pair):
+        """
+        Estimate the cost of finding the paths between a pair of heads: the number of the heads, and then the free
+        area around them (the cells the first head can reach within the number).
+        :param pair: ((x, y), (end_x, end_y))
+        :return: Tuple, bigger is more expensive
+        """
+        (x, y), _ = pair
+        length = self.get_number_in_cell(x, y)
+        return length, len(self.get_distance_field(x, y)) - self.get_distance_field(x, y).count(UNREACHABLE)
+
+    def build_domain_index(self):
+        """
+        Build a DomainIndex (see domains.py) of the possible paths of all the heads (except lazy heads), matching the
+        current coloring of this board. The index is shared by copies of the board, and the search keeps it up to
+        date with DomainIndex.apply and DomainIndex.undo.
+        :return: The DomainIndex
+        """
+        heads = [(x, y) for x, y in self.get_list_of_numbered_cells() if not self.is_lazy_head(x, y)]
+        self.domain_index = DomainIndex(self, heads)
+        return self.domain_index
+
     def get_possible_paths(self, x, y):
         """
-        Get all possible paths from the cell (x, y).
+        Get all possible paths from the cell (x, y) (cached version of find_possible_paths).
+        :param x: Row selector.
+        :param y: Column selector.
+        :return: HeadDomain of the paths (or a DomainView, if the domains are compact). Path is a list of cells (x, y).
+        """
+        if self.domain_store is not None:
+            return self.domain_store.get_domain(x, y)
+
+        if self.possible_paths[x][y] is None:
+            # Paths of length 0 and 1 are cheap and not cached
+            if self.get_number_in_cell(x, y) <= 1:
+                return self.find_possible_paths(x, y)
+
+            self.possible_paths[x][y] = self.find_possible_paths(x, y)
+
+        return self.possible_paths[x][y]
+
+    def find_possible_paths(self, x, y):
+        """
+        Find all possible paths from the cell (x, y).
         If cell is not number (has value 0), return empty list
         If cell is number (has value different from 0), return all valid paths to all (end_x, end_y) such that
         the number and number_color are the same.
         :param x: Row selector.
         :param y: Column selector.
-        :return: List of paths. Path is a list of [(number, number_color), cell_color].
+        :return: HeadDomain of the paths of the head pairs (see get_pair_paths). Path is a list of cells (x, y).
         """
-        if self.possible_paths[x][y] is None:
-            paths = []
-            length = self.get_number_in_cell(x, y)
+        length = self.get_number_in_cell(x, y)
 
-            # If no path
-            if length == 0:
-                return []
+        # If no path
+        if length == 0:
+            return HeadDomain([])
 
-            # If path contains only 1 cell, return the only possible path
-            if length == 1:
-                return [[(x, y)]]
+        # If path contains only 1 cell, return the only possible path
+        if length == 1:
+            return HeadDomain([([[(x, y)]], False)])
 
-            # Odd numbers must have odd manhattan distance between start and end
-            # Even numbers must have even manhattan distance between start and end
-            # This loop will only check possible end coordinates for the path
-            offset = length % 2 == 0
-            # For every possible x
-            for i in range(length + 1):
-                # And every other y such that i + j <= length
-                for j in range(offset, length - i, 2):
-                    end_x = x + i
-                    m_end_x = x - i
+        return HeadDomain([self.get_pair_paths(x, y, end_x, end_y, length) for end_x, end_y in
+                           self.get_possible_ends(x, y)])
 
-                    end_y = y + j
-                    m_end_y = y - j
+    def find_possible_moves(self, x, y):
+        """
+        Find all valid paths from the head (x, y) by searching the current board, where colored cells are walls.
+        Gives the same paths as get_possible_moves, without finding the possible paths of the empty board first.
+        Paths with the same footprint are all valid or all invalid together, so removing them here is the same.
+        :return: List of paths. Path is a list of cells (x, y).
+        """
+        length = self.get_number_in_cell(x, y)
+        if length == 0 or self.is_colored_cell(x, y):
+            return []
 
-                    if i != 0:
-                        paths += self.get_paths(x, y, end_x, end_y, length)
-                        paths += self.get_paths(x, y, m_end_x, end_y, length)
+        if length == 1:
+            return [[(x, y)]]
 
-                        if j != 0:
-                            paths += self.get_paths(x, y, end_x, m_end_y, length)
-                            paths += self.get_paths(x, y, m_end_x, m_end_y, length)
+        paths = []
+        walls = self.get_walls()
+        for end_x, end_y in self.get_possible_ends(x, y):
+            if not self.is_colored_cell(end_x, end_y):
+                paths += self.get_paths(x, y, end_x, end_y, length, walls)
 
-                    elif j != 0:
-                        paths += self.get_paths(x, y, end_x, end_y, length)
-                        paths += self.get_paths(x, y, end_x, m_end_y, length)
+        return paths
 
-                offset = not offset
+    def get_possible_ends(self, x, y):
+        """
+        :return: The heads that can be the other end of a path from the head (x, y), from the closest rows to the
+                 farthest
+        """
+        length = self.get_number_in_cell(x, y)
+
+        # The other end must be a head with the same number and number color.
+        # Odd numbers must have odd manhattan distance between start and end
+        # Even numbers must have even manhattan distance between start and end
+        ends = []
+        for end_x, end_y in self.heads_by_clue[(length, self.get_number_color_in_cell(x, y))]:
+            distance = abs(end_x - x) + abs(end_y - y)
+            if 0 < distance < length and distance % 2 != length % 2:
+                ends += [(end_x, end_y)]
+
+        # Go over the ends from the closest rows to the farthest (the order the paths always had)
+        ends.sort(key=lambda end: (abs(end[0] - x), abs(end[1] - y), (end[0] < x) + 2 * (end[1] < y)))
+        return ends
+
+    def get_pair_paths(self, x, y, end_x, end_y, length):
+        """
+        Find all valid paths from (x, y) to (end_x, end_y), like get_paths.
+        The paths of each pair of heads are found only once, from the head that comes first (top to bottom), and
+        shared by both heads: the other head reverses them when it uses them (see domains.HeadDomain).
+        :return: Tuple (paths, reverse). paths is a list of paths from the first head of the pair, reverse is True if
+                 (x, y) is the other head. Path is a list of cells (x, y).
+        """
+        if not self.is_head_pair(x, y, end_x, end_y, length):
+            return [], False
 
-            self.possible_paths[x][y] = paths
+        pair = ((x, y), (end_x, end_y)) if (x, y) < (end_x, end_y) else ((end_x, end_y), (x, y))
+        if pair not in self.pair_paths:
+            self.pair_paths[pair] = self.get_paths(pair[0][0], pair[0][1], pair[1][0], pair[1][1], length)
 
-        return self.possible_paths[x][y]
+        return self.pair_paths[pair], pair[0] != (x, y)
 
-    def get_paths(self, x, y, end_x, end_y, length):
+    def get_paths(self, x, y, end_x, end_y, length, walls=None):
         """
         Find all valid paths from (x, y) to (end_x, end_y).
         If values are out of range or not the same (has same number or number_color) return empty list.
@@ -232,61 +609,383 @@ class Board:
         :param end_x: Row selector for end position.
         :param end_y: Column selector for end position.
         :param length: Length of path to look for.
-        :return: List of paths. Path is a list of [(number, number_color), cell_color].
+        :param walls: Cells the paths can't pass through (see get_walls). Only the numbered cells if not given.
+        :return: List of paths. Path is a list of cells (x, y).
         """
         # If function parameters are not valid, return empty list
-        if end_x < 0 or self.get_height() <= end_x or end_y < 0 or self.get_width() <= end_y \
-                or self.get_number_in_cell(end_x, end_y) != length \
-                or self.get_number_color_in_cell(x, y) != self.get_number_color_in_cell(end_x, end_y):
+        if not self.is_head_pair(x, y, end_x, end_y, length):
             return []
 
-        # Run recursive search on board
-        paths = self.get_paths_rec([(x, y)], end_x, end_y, length - 1, length)
-        paths_mask = [True for i in range(len(paths))]
-
-        # Remove paths with same footprint. The board must have only 1 solution, so if 2 or more paths cover
-        # the same cells in different order, all of them must be invalid (Assume one of them is the right path =>
-        # => The other is also valid => There is more than one solution to the board).
-        for i, path_A in enumerate(paths):
-            for j, path_B in enumerate(paths[i + 1:], start=(i + 1)):
-                if paths_mask[j] is True and len(path_A) == len(path_B) and set(path_A) == set(path_B):
-                    paths_mask[i] = False
-                    paths_mask[j] = False
-
-        return [path for i, path in enumerate(paths) if paths_mask[i]]
-
-    def get_paths_rec(self, current_path, end_x, end_y, steps, length):
-        """
-        Recursive function that finds all valid paths from (x, y) to (end_x, end_y).
-        :return: List of paths. Path is a list of [(number, number_color), cell_color].
-        """
-        x, y = current_path[-1]
-
-        # If end of steps
-        if steps == 0:
-            # And got to end, return path found
-            if current_path[-1] == (end_x, end_y):
-                return [current_path]
-            # Otherwise, path don't lead to end
-            else:
-                return []
-
-        # If end is too far for path or we got to a number (we checked earlier and this is not the end point)
-        #  don't continue search for this direction
-        if manhattan_distance((x, y), (end_x, end_y)) > steps \
-                or (self.get_number_in_cell(x, y) != 0 and length - 1 != steps):
-            return []
+        if walls is None:
+            walls = self.numbered_cells_flags
 
-        # Collect valid paths from this point
-        paths = []
-        possible_steps = [(x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)]
+        # Short paths are made from the shapes library (already without duplicate footprints)
+        if length <= SHAPE_LIBRARY_MAX_LENGTH:
+            return find_walks_from_shapes(self.get_width(), self.get_height(), walls, (x, y), (end_x, end_y), length)
 
-        for possible_step in possible_steps:
-            # If point not on board or point already in path, skip it
-            if possible_step[0] < 0 or self.get_height() <= possible_step[0] or possible_step[1] < 0 \
-                    or self.get_width() <= possible_step[1] or possible_step in current_path:
-                continue
+        # Run search on board. Long paths are searched from both ends
+        if length >= self.bidirectional_min_length:
+            paths = find_walks_bidirectional(self.get_width(), self.get_height(), walls, (x, y), (end_x, end_y),
+                                             length, self.get_distance_field(end_x, end_y),
+                                             self.get_distance_field(x, y))
+        else:
+            paths = find_walks(self.get_width(), self.get_height(), walls, (x, y), (end_x, end_y), length,
+                               self.get_distance_field(end_x, end_y))
 
-            paths += self.get_paths_rec(current_path + [possible_step], end_x, end_y, steps - 1, length)
+        # Remove paths with same footprint (see remove_duplicate_footprints)
+        return remove_duplicate_footprints(paths)
 
-        return paths
+
+class Board(BaseBoard):
+    """
+    A Board describes the current state of the game board. It's separate from
+    the game engine to allow the Input objects to check if their moves are valid,
+    etc... without the help of the game engine.
+
+    The Board stores:
+    - board_w/board_h: the width and height of the playing area
+    - state: a matrix (2D list) of cells
+    - matrix: a matrix (2D list) of [(number, number_color), cell_color]
+    - colors: the number of the colors
+    """
+
+    def __copy__(self):
+        cpy_board = self.__new__(self.__class__)  # Create empty object
+        cpy_board.__dict__.update(self.__dict__)  # Shallow copy everything
+        cpy_board.coloring_matrix = copy.deepcopy(self.coloring_matrix)  # Deep copy only the coloring matrix
+        cpy_board.trail = self.trail[:]
+
+        return cpy_board
+
+    def get_shared_copy(self, rows):
+        """
+        A copy that shares structure with this board: the rows of the coloring matrix are shared, except the given
+        rows, which are copied so they can be changed without changing this board.
+        :param rows: The rows (x) the copy is going to change
+        """
+        cpy_board = self.__new__(self.__class__)
+        cpy_board.__dict__.update(self.__dict__)
+        cpy_board.coloring_matrix = self.coloring_matrix[:]
+        for x in rows:
+            cpy_board.coloring_matrix[x] = self.coloring_matrix[x][:]
+        cpy_board.trail = []
+
+        return cpy_board
+
+
+class BitBoard(Board):
+    """
+    A Board backend that keeps the occupancy of the cells as Python big-int bitmasks, alongside the regular
+    coloring matrix (which is still used by the GUI and the goal check).
+
+    Cell (x, y) is represented by the bit x * board_w + y.
+
+    The BitBoard stores (on top of Board):
+    - occupied: bitmask of all the colored cells
+    - color_masks: list of bitmasks, one for each color, of the cells colored in that color
+    - possible_masks: a matrix (2D list) of the bitmasks of the possible paths, in the same order as possible_paths
+    """
+
+    def __init__(self, num_of_colors, numbers_matrix, coloring_matrix=None):
+        super().__init__(num_of_colors, numbers_matrix, coloring_matrix)
+
+        self.occupied = 0
+        self.color_masks = [0 for i in range(self.num_of_colors)]
+        for i in range(self.get_height()):
+            for j in range(self.get_width()):
+                if self.coloring_matrix[i][j]:
+                    self._color_bit(self.get_cell_bit(i, j), self.coloring_matrix[i][j])
+
+        self.possible_masks = [[None for i in range(self.get_width())] for j in range(self.get_height())]
+        self.occupancy_array = None
+
+    def __eq__(self, other):
+        if isinstance(other, BitBoard):
+            return self.zobrist_key == other.zobrist_key and self.color_masks == other.color_masks
+        return super().__eq__(other)
+
+    def __hash__(self):
+        return super().__hash__()
+
+    def __copy__(self):
+        cpy_board = super().__copy__()
+        cpy_board.color_masks = self.color_masks[:]  # Masks are ints, so a shallow copy of the list is enough
+
+        return cpy_board
+
+    def get_shared_copy(self, rows):
+        cpy_board = super().get_shared_copy(rows)
+        cpy_board.color_masks = self.color_masks[:]
+
+        return cpy_board
+
+    # *** Bits *** #
+    def get_cell_bit(self, x, y):
+        """
+        :return: The bit that represents the cell (x, y)
+        """
+        return 1 << (x * self.get_width() + y)
+
+    def get_path_mask(self, path):
+        """
+        :param path: List of cells (x, y)
+        :return: Bitmask of all the cells in the path
+        """
+        width = self.get_width()
+        mask = 0
+        for x, y in path:
+            mask |= 1 << (x * width + y)
+        return mask
+
+    def get_occupancy_array(self):
+        """
+        :return: Flat boolean array (size board_w * board_h), True for colored cells. Cell (x, y) is x * board_w + y
+        """
+        # Boards that share the same occupancy (copies that weren't changed) share the array
+        if self.occupancy_array is None or self.occupancy_array[0] != self.occupied:
+            size = self.get_width() * self.get_height()
+            occupied_bytes = np.frombuffer(self.occupied.to_bytes((size + 7) // 8, 'little'), dtype=np.uint8)
+            self.occupancy_array = (self.occupied,
+                                    np.unpackbits(occupied_bytes, count=size, bitorder='little').view(bool))
+
+        return self.occupancy_array[1]
+
+    def get_possible_masks(self, x, y):
+        """
+        :return: The bitmasks of the paths returned by get_possible_paths(x, y), in the same order (a path and its
+                 reverse have the same mask, so the masks are of the stored paths, see HeadDomain.iter_stored)
+        """
+        if self.possible_masks[x][y] is None:
+            paths = self.get_possible_paths(x, y).iter_stored()
+            self.possible_masks[x][y] = [self.get_path_mask(path) for path in paths]
+
+        return self.possible_masks[x][y]
+
+    def _color_bit(self, bit, cell_color):
+        """
+        Set the occupancy of a single cell bit to the given color (color 0 clears the cell)
+        """
+        if self.occupied & bit:
+            for color in range(self.num_of_colors):
+                self.color_masks[color] &= ~bit
+            self.occupied &= ~bit
+
+        if cell_color:
+            self.color_masks[cell_color] |= bit
+            self.occupied |= bit
+
+    # *** Boolean Getters *** #
+    def is_colored_cell(self, x, y):
+        """
+        :return: True if the cell (x, y) is colored, else False
+        """
+        return self.occupied & self.get_cell_bit(x, y) != 0
+
+    def is_valid_path(self, path):
+        """
+        :param path: The path we want to check
+        :return: True if the path is valid - no cell is already colored, else False
+        """
+        return self.occupied & self.get_path_mask(path) == 0
+
+    # *** Setters *** #
+    def set_cell_coloring(self, x, y, cell_color):
+        """
+        The function colors the cell (x, y) in the given color
+        """
+        self.update_zobrist_key(x, y, cell_color)
+        self.coloring_matrix[x][y] = cell_color
+        self._color_bit(self.get_cell_bit(x, y), cell_color)
+
+    def set_cells_coloring(self, cells, cell_color):
+        """
+        Fill all the cells in list with the given color
+        :param cells: List of cells (x, y)
+        :param cell_color: Color indicator
+        """
+        for cell in cells:
+            self.update_zobrist_key(cell[0], cell[1], cell_color)
+            self.coloring_matrix[cell[0]][cell[1]] = cell_color
+
+        mask = self.get_path_mask(cells)
+        if self.occupied & mask:
+            for color in range(self.num_of_colors):
+                self.color_masks[color] &= ~mask
+            self.occupied &= ~mask
+
+        if cell_color:
+            self.color_masks[cell_color] |= mask
+            self.occupied |= mask
+
+    def get_possible_moves(self, x, y):
+        """
+        :return: All valid paths from the head (x, y) to another head
+        """
+        if self.domain_store is not None or self.is_lazy_head(x, y) or self.uses_domain_index(x, y):
+            return super().get_possible_moves(x, y)
+
+        # Test the masks first, only the valid paths are reversed (see HeadDomain.filter_masks)
+        return self.get_possible_paths(x, y).filter_masks(self.get_possible_masks(x, y), self.occupied)
+
+    def has_any_move(self, x, y):
+        """
+        Check if the head (x, y) has at least one valid path, without finding all of them.
+        The first valid path found (the witness) is remembered, and checked first next time.
+        :return: True if the head has a valid path, else False
+        """
+        if self.domain_store is not None or self.is_lazy_head(x, y) or self.uses_domain_index(x, y):
+            return super().has_any_move(x, y)
+
+        witness = self.move_witnesses.get((x, y))
+        if witness is not None and self.is_valid_path(witness):
+            return True
+
+        occupied = self.occupied
+        paths = self.get_possible_paths(x, y)
+        for path in paths.iter_selected(not occupied & mask for mask in self.get_possible_masks(x, y)):
+            self.move_witnesses[(x, y)] = path
+            return True
+        return False
+
+    def count_moves(self, x, y, limit=None):
+        """
+        Count the valid paths from the head (x, y), without building the list of them.
+        :param limit: Stop counting when getting to limit, None to count all the paths.
+        :return: The number of valid paths (at most limit)
+        """
+        if self.domain_store is not None or self.is_lazy_head(x, y) or self.uses_domain_index(x, y):
+            return super().count_moves(x, y, limit)
+
+        occupied = self.occupied
+        count = 0
+        for mask in self.get_possible_masks(x, y):
+            if not occupied & mask:
+                count += 1
+                if count == limit:
+                    break
+        return count
+
+
+class CompactBoard(BaseBoard):
+    """
+    A compact Board backend: the coloring is a flat bytearray that copies with a single memcpy, the clues are flat
+    tuples shared by all the copies, and the attributes are kept in __slots__ instead of a __dict__.
+    The coloring_matrix and numbers_matrix of Board are built only when asked for (the GUI uses them), and setting
+    them fills the flat storage.
+
+    Cell (x, y) is stored at x * board_w + y.
+
+    The CompactBoard stores (instead of the matrices of Board):
+    - board_w/board_h: the width and height of the playing area
+    - numbers: tuple of the number in each cell (0 for no number)
+    - number_colors: tuple of the color of the number in each cell
+    - coloring: bytearray of the color of each cell (0 for empty cells)
+    """
+
+    __slots__ = ('num_of_colors', 'board_w', 'board_h', 'numbers', 'number_colors', 'coloring', 'possible_paths',
+                 'numbered_cells', 'numbered_cells_flags', 'heads_by_clue', 'distance_fields', 'pair_paths',
+                 'move_witnesses', 'zobrist_table', 'zobrist_key', 'trail', 'domain_store', 'domain_index',
+                 'lazy_domain_min_length', 'bidirectional_min_length')
+
+    @property
+    def numbers_matrix(self):
+        return [[(self.numbers[i * self.board_w + j], self.number_colors[i * self.board_w + j])
+                 for j in range(self.board_w)] for i in range(self.board_h)]
+
+    @numbers_matrix.setter
+    def numbers_matrix(self, numbers_matrix):
+        self.board_h = len(numbers_matrix)
+        self.board_w = len(numbers_matrix[0])
+        self.numbers = tuple(number for row in numbers_matrix for number, number_color in row)
+        self.number_colors = tuple(number_color for row in numbers_matrix for number, number_color in row)
+
+    @property
+    def coloring_matrix(self):
+        """
+        A copy of the coloring as a matrix (2D list), changing it doesn't change the board
+        """
+        return [list(self.coloring[i * self.board_w:(i + 1) * self.board_w]) for i in range(self.board_h)]
+
+    @coloring_matrix.setter
+    def coloring_matrix(self, coloring_matrix):
+        self.coloring = bytearray(cell_color for row in coloring_matrix for cell_color in row)
+
+    def __eq__(self, other):
+        if isinstance(other, CompactBoard):
+            return self.zobrist_key == other.zobrist_key and self.coloring == other.coloring
+        return super().__eq__(other)
+
+    def __hash__(self):
+        return super().__hash__()
+
+    def __copy__(self):
+        cpy_board = self.get_shared_copy(())
+        cpy_board.trail = self.trail[:]
+
+        return cpy_board
+
+    def get_shared_copy(self, rows):
+        """
+        Everything but the coloring is shared. The coloring is copied whole, a single memcpy is cheaper than sharing
+        its rows.
+        """
+        cpy_board = self.__new__(self.__class__)
+        for name in CompactBoard.__slots__:
+            setattr(cpy_board, name, getattr(self, name))
+        cpy_board.coloring = self.coloring[:]
+        cpy_board.trail = []
+
+        return cpy_board
+
+    # *** Boolean Getters *** #
+    def is_numbered_cell(self, x, y):
+        return self.numbers[x * self.board_w + y] != 0
+
+    def is_colored_cell(self, x, y):
+        return self.coloring[x * self.board_w + y] != 0
+
+    def is_valid_path(self, path):
+        width = self.board_w
+        coloring = self.coloring
+        for x, y in path:
+            if coloring[x * width + y]:
+                return False
+        return True
+
+    # *** Getters *** #
+    def get_number_in_cell(self, x, y):
+        return self.numbers[x * self.board_w + y]
+
+    def get_number_color_in_cell(self, x, y):
+        return self.number_colors[x * self.board_w + y]
+
+    def get_cell_coloring(self, x, y):
+        return self.coloring[x * self.board_w + y]
+
+    def get_width(self):
+        return self.board_w
+
+    def get_height(self):
+        return self.board_h
+
+    def get_occupancy_array(self):
+        return np.frombuffer(self.coloring, dtype=np.uint8).astype(bool)
+
+    # *** Setters *** #
+    def set_cell_coloring(self, x, y, cell_color):
+        self.set_cells_coloring(((x, y),), cell_color)
+
+    def set_cells_coloring(self, cells, cell_color):
+        width = self.board_w
+        coloring = self.coloring
+        table = self.zobrist_table
+        key = self.zobrist_key
+        for x, y in cells:
+            cell = x * width + y
+            key ^= table[cell][coloring[cell]] ^ table[cell][cell_color]
+            coloring[cell] = cell_color
+        self.zobrist_key = key
+
+    def update_zobrist_key(self, x, y, cell_color):
+        keys = self.zobrist_table[x * self.board_w + y]
+        self.zobrist_key ^= keys[self.coloring[x * self.board_w + y]] ^ keys[cell_color]
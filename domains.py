@@ -0,0 +1,670 @@
+import hashlib
+import os
+import shutil
+from itertools import compress, islice
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from paths import SHAPES_VERSION
+
+PATH_TO_DOMAINS = './cache/domains'
+DOMAINS_VERSION = 1  # Change when the rules of the paths enumeration change, so old cache entries are not used
+DOMAINS_CACHE_MAX_BYTES = 512 * 1024 * 1024  # Least recently used entries are removed above this size
+DOMAINS_ARRAYS = ('heads', 'cells', 'path_offsets', 'head_offsets')  # The files of a cache entry
+
+
+def get_domains_key(board):
+    """
+    :return: Hex string that identifies the domains of the board: a hash of the versions of the enumeration and of
+             the shapes (see paths.get_shapes), the size of the board, and the heads with their clues.
+    """
+    clues = [(x, y, board.get_number_in_cell(x, y), board.get_number_color_in_cell(x, y))
+             for x, y in board.get_list_of_numbered_cells()]
+    key = (DOMAINS_VERSION, SHAPES_VERSION, board.get_width(), board.get_height(), clues)
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+def get_cached_domain_store(board, cache_path=PATH_TO_DOMAINS, max_bytes=DOMAINS_CACHE_MAX_BYTES):
+    """
+    Load the DomainStore of the board from the cache (memory mapped), or build it and save it to the cache.
+    :param board: Board object
+    :param cache_path: The cache directory, an entry is a directory of .npy files for each board
+    :param max_bytes: Size of the cache, least recently used entries are removed above it
+    :return: DomainStore
+    """
+    entry_path = f'{cache_path}/{get_domains_key(board)}'
+    if os.path.isdir(entry_path):
+        os.utime(entry_path)  # Mark as recently used
+        return DomainStore.load(entry_path, board.get_width(), board.get_height())
+
+    store = DomainStore.from_board(board)
+    store.save(entry_path)
+    evict_domains_cache(cache_path, max_bytes, keep=entry_path)
+    return store
+
+
+def evict_domains_cache(cache_path, max_bytes, keep=None):
+    """
+    Remove the least recently used entries of the cache until it is no bigger than max_bytes.
+    :param keep: Entry path that is never removed
+    """
+    entries = []
+    for name in os.listdir(cache_path):
+        entry_path = f'{cache_path}/{name}'
+        if os.path.isdir(entry_path) and entry_path != keep:
+            size = sum(os.path.getsize(f'{entry_path}/{file}') for file in os.listdir(entry_path))
+            entries.append((os.path.getmtime(entry_path), size, entry_path))
+
+    total = sum(size for _, size, _ in entries)
+    if keep is not None and os.path.isdir(keep):
+        total += sum(os.path.getsize(f'{keep}/{file}') for file in os.listdir(keep))
+
+    for _, size, entry_path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry_path, ignore_errors=True)
+        total -= size
+
+
+class DomainStore:
+    """
+    Compact storage of the possible paths (the domains) of all the heads of a board, in CSR layout.
+
+    Cell (x, y) is stored as the flat index x * board_w + y, so a path is a run of int32 cell indices.
+
+    The DomainStore stores:
+    - width/height: the width and height of the board the domains were built for
+    - heads: list of the heads (x, y), in the order their domains are stored
+    - cells: flat int32 array with the cells of all the paths, path after path
+    - path_offsets: path p is cells[path_offsets[p]:path_offsets[p + 1]]
+    - head_offsets: head h owns the path ids head_offsets[h]:head_offsets[h + 1]
+
+    The arrays can be published in shared memory (see share), so other processes attach them without a copy.
+    """
+
+    def __init__(self, width, height, heads, cells, path_offsets, head_offsets):
+        self.width = width
+        self.height = height
+        self.heads = heads
+        self.cells = cells
+        self.path_offsets = path_offsets
+        self.head_offsets = head_offsets
+
+        self.head_index = {head: i for i, head in enumerate(heads)}
+
+        # The shared memory block of the arrays, if they are in shared memory (see share and attach)
+        self.shared_memory = None
+
+    @classmethod
+    def from_board(cls, board):
+        """
+        Enumerate the domains of all the heads of the board and pack them into a store.
+        Domains are enumerated one head at a time, so only a single domain is held as tuples at once.
+        :param board: Board object
+        :return: DomainStore
+        """
+        heads = list(board.get_list_of_numbered_cells())
+        # The paths of a pair are stored twice, once for each head (reversed for the second head): DomainIndex and
+        # Propagator need the paths of every head in one contiguous range of path ids (head_paths, live bitsets),
+        # so the store and its cache don't share pairs like Board.pair_paths does.
+        return cls.from_domains(board.get_width(), board.get_height(), heads,
+                                (board.find_possible_paths(x, y) for x, y in heads))
+
+    @classmethod
+    def from_domains(cls, width, height, heads, domains):
+        """
+        Pack domains into a store.
+        :param heads: List of heads (x, y)
+        :param domains: Iterable of lists of paths, one for every head (in the same order as heads)
+        :return: DomainStore
+        """
+        cells = []
+        path_offsets = [0]
+        head_offsets = [0]
+        for paths in domains:
+            for path in paths:
+                cells.extend([x * width + y for x, y in path])
+                path_offsets.append(len(cells))
+            head_offsets.append(len(path_offsets) - 1)
+
+        return cls(width, height, heads,
+                   np.array(cells, dtype=np.int32),
+                   np.array(path_offsets, dtype=np.int32),
+                   np.array(head_offsets, dtype=np.int32))
+
+    @classmethod
+    def load(cls, dir_path, width, height):
+        """
+        Load a store saved with save. The arrays are memory mapped, so only the pages that are used are read.
+        :return: DomainStore
+        """
+        arrays = {name: np.load(f'{dir_path}/{name}.npy', mmap_mode='r') for name in DOMAINS_ARRAYS}
+        heads = [(int(x), int(y)) for x, y in arrays['heads']]
+        return cls(width, height, heads, arrays['cells'], arrays['path_offsets'], arrays['head_offsets'])
+
+    def save(self, dir_path):
+        """
+        Save the arrays of the store as .npy files in dir_path (see load).
+        """
+        # Write to a temporary directory first, so other processes never read half an entry
+        tmp_path = f'{dir_path}.{os.getpid()}'
+        os.makedirs(tmp_path, exist_ok=True)
+        np.save(f'{tmp_path}/heads.npy', np.array(self.heads, dtype=np.int32).reshape(-1, 2))
+        np.save(f'{tmp_path}/cells.npy', self.cells)
+        np.save(f'{tmp_path}/path_offsets.npy', self.path_offsets)
+        np.save(f'{tmp_path}/head_offsets.npy', self.head_offsets)
+        try:
+            os.replace(tmp_path, dir_path)
+        except OSError:
+            # Another process saved the same entry first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def share(self, key):
+        """
+        Copy the arrays of the store to a new shared memory block, and use them from there.
+        The block stays until release is called (by this process, the one that created it).
+        :param key: Identifies the domains (see get_domains_key), checked when other processes attach
+        :return: Picklable descriptor of the block, to pass to attach in other processes
+        """
+        heads = np.array(self.heads, dtype=np.int32).reshape(-1, 2)
+        arrays = (heads, self.cells, self.path_offsets, self.head_offsets)
+        self.shared_memory = shared_memory.SharedMemory(create=True, size=max(sum(a.nbytes for a in arrays), 1))
+
+        offset = 0
+        shared_arrays = []
+        for array in arrays:
+            shared_array = np.ndarray(array.shape, dtype=np.int32, buffer=self.shared_memory.buf, offset=offset)
+            shared_array[...] = array
+            shared_arrays.append(shared_array)
+            offset += array.nbytes
+        _, self.cells, self.path_offsets, self.head_offsets = shared_arrays
+
+        return self.shared_memory.name, key, self.width, self.height, tuple(len(array) for array in arrays)
+
+    @classmethod
+    def attach(cls, descriptor, key):
+        """
+        Attach a store shared by another process (see share). The arrays are read-only views of the shared memory.
+        :param descriptor: The descriptor returned by share
+        :param key: Identifies the domains of the board that attaches (see get_domains_key)
+        :return: DomainStore
+        """
+        name, shared_key, width, height, lengths = descriptor
+        if key != shared_key:
+            raise ValueError('The shared domains are of a different board')
+
+        # Child processes share the resource tracker of their parent, which keeps the block until release
+        block = shared_memory.SharedMemory(name=name)
+
+        offset = 0
+        arrays = []
+        for shape in ((lengths[0], 2),) + tuple((length,) for length in lengths[1:]):
+            array = np.ndarray(shape, dtype=np.int32, buffer=block.buf, offset=offset)
+            array.flags.writeable = False
+            arrays.append(array)
+            offset += array.nbytes
+
+        heads = [(int(x), int(y)) for x, y in arrays[0]]
+        store = cls(width, height, heads, arrays[1], arrays[2], arrays[3])
+        store.shared_memory = block
+        return store
+
+    def release(self):
+        """
+        Remove the shared memory block that share created. Stores attached to it must not be used after that.
+        """
+        if self.shared_memory is not None:
+            self.cells, self.path_offsets, self.head_offsets = \
+                self.cells.copy(), self.path_offsets.copy(), self.head_offsets.copy()
+            self.shared_memory.close()
+            self.shared_memory.unlink()
+            self.shared_memory = None
+
+    def __len__(self):
+        """
+        :return: The number of paths in the store
+        """
+        return len(self.path_offsets) - 1
+
+    # *** Getters *** #
+    def get_domain(self, x, y):
+        """
+        :return: DomainView of all the paths of the head (x, y). Empty view if (x, y) is not a head
+        """
+        h = self.head_index.get((x, y))
+        if h is None:
+            return DomainView(self, np.empty(0, dtype=np.int32))
+        return DomainView(self, np.arange(self.head_offsets[h], self.head_offsets[h + 1], dtype=np.int32))
+
+    def get_path_cells(self, path_id):
+        """
+        :return: The flat cell indices of the path (a view, no copy)
+        """
+        return self.cells[self.path_offsets[path_id]:self.path_offsets[path_id + 1]]
+
+    def get_path(self, path_id):
+        """
+        :return: The path as a list of cells (x, y)
+        """
+        return [(int(cell) // self.width, int(cell) % self.width) for cell in self.get_path_cells(path_id)]
+
+    def get_valid_path_ids(self, path_ids, occupancy):
+        """
+        Filter path ids, keeping only paths that don't cover an occupied cell.
+        :param path_ids: int32 array of path ids
+        :param occupancy: Flat boolean array (size board_w * board_h), True for colored cells
+        :return: int32 array of the valid path ids, in the same order
+        """
+        if len(path_ids) == 0:
+            return path_ids
+
+        starts = self.path_offsets[path_ids]
+        lengths = self.path_offsets[path_ids + 1] - starts
+        segments = np.zeros(len(path_ids), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=segments[1:])
+
+        # Gather the cells of all the paths back to back, and reduce each path's segment with OR
+        gather = np.repeat(starts - segments, lengths) + np.arange(segments[-1] + lengths[-1])
+        blocked = np.logical_or.reduceat(occupancy[self.cells[gather]], segments)
+
+        return path_ids[~blocked]
+
+    def get_nbytes(self):
+        """
+        :return: The memory used by the arrays of the store, in bytes
+        """
+        return self.cells.nbytes + self.path_offsets.nbytes + self.head_offsets.nbytes
+
+
+class DomainView:
+    """
+    A lightweight view of some of the paths in a DomainStore.
+    Scanning the view (filtering, counting) runs on the flat arrays of the store. Paths are converted to lists of
+    cells (x, y) only when they are indexed or iterated.
+    """
+
+    def __init__(self, store, path_ids):
+        self.store = store
+        self.path_ids = path_ids
+
+    def __len__(self):
+        return len(self.path_ids)
+
+    def __getitem__(self, i):
+        return self.store.get_path(self.path_ids[i])
+
+    def __iter__(self):
+        for path_id in self.path_ids:
+            yield self.store.get_path(path_id)
+
+    def filter_valid(self, occupancy):
+        """
+        :param occupancy: Flat boolean array (size board_w * board_h), True for colored cells
+        :return: DomainView of the paths that don't cover an occupied cell
+        """
+        return DomainView(self.store, self.store.get_valid_path_ids(self.path_ids, occupancy))
+
+
+class HeadDomain:
+    """
+    The possible paths of a head, made of the paths of its head pairs (see Board.get_pair_paths).
+    The paths of a pair are stored once and shared by both heads of the pair: the head that comes first (top to
+    bottom) uses them as they are, and the other head reverses them when they are indexed or iterated.
+    """
+
+    def __init__(self, parts):
+        """
+        :param parts: List of (paths, reverse), the paths of each pair of the head, reverse is True if the paths
+                      start at the other head of the pair
+        """
+        self.parts = parts
+        self.length = sum(len(paths) for paths, reverse in parts)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.length
+        for paths, reverse in self.parts:
+            if i < len(paths):
+                return paths[i][::-1] if reverse else paths[i]
+            i -= len(paths)
+        raise IndexError('HeadDomain index out of range')
+
+    def __iter__(self):
+        for paths, reverse in self.parts:
+            if reverse:
+                for path in paths:
+                    yield path[::-1]
+            else:
+                yield from paths
+
+    def iter_stored(self):
+        """
+        Iterate over the paths as they are stored, without reversing them. A path and its reverse cover the same
+        cells, so checks of the cells (validity, masks) can run on the stored paths.
+        """
+        for paths, reverse in self.parts:
+            yield from paths
+
+    def filter_paths(self, is_valid):
+        """
+        :param is_valid: Function of a path, True to keep it. Runs on the stored paths (see iter_stored)
+        :return: List of the kept paths, only they are reversed
+        """
+        kept = []
+        for paths, reverse in self.parts:
+            if reverse:
+                kept += [path[::-1] for path in paths if is_valid(path)]
+            else:
+                kept += [path for path in paths if is_valid(path)]
+        return kept
+
+    def filter_masks(self, masks, occupied):
+        """
+        :param masks: Bitmasks of the cells of the paths, in the order of iter_stored
+        :param occupied: Bitmask of the colored cells
+        :return: List of the paths whose mask doesn't intersect occupied. The masks are tested first, only the kept
+                 paths are reversed
+        """
+        masks = iter(masks)
+        kept = []
+        for paths, reverse in self.parts:
+            # zip takes a path before a mask, so it takes exactly the masks of this part
+            if reverse:
+                kept += [path[::-1] for path, mask in zip(paths, masks) if not occupied & mask]
+            else:
+                kept += [path for path, mask in zip(paths, masks) if not occupied & mask]
+        return kept
+
+    def iter_selected(self, selected):
+        """
+        Iterate over the selected paths, reversing only them.
+        :param selected: Iterable of booleans, one for each path in the order of iter_stored. It is consumed lazily,
+                         so it can be a generator that checks the stored paths.
+        """
+        selected = iter(selected)
+        for paths, reverse in self.parts:
+            kept = compress(paths, islice(selected, len(paths)))
+            if reverse:
+                for path in kept:
+                    yield path[::-1]
+            else:
+                yield from kept
+
+
+class DomainIndex:
+    """
+    Inverted index from the cells of the board to the possible paths that cover them, with a live count of the
+    valid paths of each head. Coloring a path only updates the paths that cover its cells, and the change can be
+    undone when the search backtracks.
+
+    The index matches the coloring of a single board at a time (the search's current board), and boards use it only
+    when they are that board (see Board.uses_domain_index).
+
+    The DomainIndex stores:
+    - store: the DomainStore of the paths. The board's own store when it has one for exactly the indexed heads
+             (shared or attached stores are used without a copy), else a store packed from the possible paths
+    - heads: dictionary {head (x, y): head id}
+    - path_heads: int32 array, the head id of each path id
+    - head_paths: list of int32 arrays, the path ids of each head id
+    - cell_path_ids/cell_offsets: the ids of the paths that cover the flat cell c (x * board_w + y) are
+                                  cell_path_ids[cell_offsets[c]:cell_offsets[c + 1]]
+    - blocked: int32 array, the number of colored cells in each path, path is valid if 0
+    - live_counts: int32 array, the number of valid paths of each head id
+    - covering_paths: dictionary {cells: (path ids, counts)}, see get_covering_paths
+    - board: the board whose coloring the index matches
+    - unindexed_heads: list of the heads (x, y) of the board that are not in the index
+    - wipe_out: True if the last apply left a head that isn't colored without valid paths (forward checking)
+    - wiped_heads: list of the head ids that the last apply left without valid paths
+    - last_affected: array of the head ids that lost valid paths in the last apply
+    - head_cells: list of the heads (x, y), by head id
+    - path_ends: int32 array, the head id of the last cell of each path id (-1 if not indexed)
+    - path_cells/path_offsets: the flat cells of path p are path_cells[path_offsets[p]:path_offsets[p + 1]] (the
+                               arrays of the store)
+    Paths are converted to lists of cells (x, y) only when they are asked for (see get_moves and get_path).
+    """
+
+    def __init__(self, board, heads):
+        """
+        :param board: The board to index, may already have colored cells.
+        :param heads: The heads (x, y) to index.
+        """
+        heads = list(heads)
+        self.width = board.get_width()
+        self.size = board.get_width() * board.get_height()
+
+        store = board.domain_store
+        if store is None or store.heads != heads:
+            store = DomainStore.from_domains(board.get_width(), board.get_height(), heads,
+                                             (board.get_possible_paths(x, y) for x, y in heads))
+        self.store = store
+        self.path_cells = store.cells
+        self.path_offsets = store.path_offsets
+        num_paths = len(self.path_offsets) - 1
+
+        self.heads = {head: i for i, head in enumerate(heads)}
+        self.head_cells = heads
+        self.board = board
+        self.path_heads = np.repeat(np.arange(len(heads), dtype=np.int32), np.diff(store.head_offsets))
+        self.head_paths = [np.arange(store.head_offsets[i], store.head_offsets[i + 1], dtype=np.int32)
+                           for i in range(len(heads))]
+
+        # Sort the cells of all the paths by cell, the stable sort keeps the path ids of each cell in order
+        path_lengths = np.diff(self.path_offsets)
+        order = np.argsort(self.path_cells, kind='stable')
+        self.cell_path_ids = np.repeat(np.arange(num_paths, dtype=np.int32), path_lengths)[order]
+        self.cell_offsets = np.zeros(self.size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.path_cells, minlength=self.size), out=self.cell_offsets[1:])
+
+        if num_paths:
+            occupancy = board.get_occupancy_array().astype(np.int32)
+            self.blocked = np.add.reduceat(occupancy[self.path_cells], self.path_offsets[:-1]).astype(np.int32)
+        else:
+            self.blocked = np.empty(0, dtype=np.int32)
+
+        cell_heads = np.full(self.size, -1, dtype=np.int32)
+        for head_id, (x, y) in enumerate(heads):
+            cell_heads[x * self.width + y] = head_id
+        self.path_ends = cell_heads[self.path_cells[self.path_offsets[1:] - 1]] if num_paths else self.path_heads
+
+        self.live_counts = np.bincount(self.path_heads[self.blocked == 0], minlength=len(heads)).astype(np.int32)
+        self.covering_paths = {}
+        self.unindexed_heads = [head for head in board.get_list_of_numbered_cells() if head not in self.heads]
+        self.wipe_out = False
+        self.wiped_heads = []
+        self.last_affected = np.empty(0, dtype=np.int64)
+
+    def get_covering_paths(self, cells):
+        """
+        :return: The ids of the paths that cover the cells, and how many of the cells each of them covers.
+                 Saved for each list of cells, since the search colors the same paths many times.
+        """
+        key = tuple(cells)
+        if key not in self.covering_paths:
+            covering = [self.get_cell_paths(x * self.width + y) for x, y in cells]
+            if covering:
+                self.covering_paths[key] = np.unique(np.concatenate(covering), return_counts=True)
+            else:
+                self.covering_paths[key] = (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32))
+
+        return self.covering_paths[key]
+
+    def apply(self, cells, board):
+        """
+        Update the index after the cells were colored.
+        :param cells: List of cells (x, y) that were empty and are now colored.
+        :param board: The board with the cells colored, the index matches it from now on.
+        """
+        path_ids, counts = self.get_covering_paths(cells)
+        affected = self.block(path_ids, counts)
+        self.board = board
+
+        # Only the heads that lost paths can be left without any. The heads at the ends of the cells are colored now
+        wiped = affected[self.live_counts[affected] == 0]
+        colored_heads = [self.heads[cell] for cell in (cells[0], cells[-1]) if cell in self.heads]
+        self.wiped_heads = [head for head in wiped.tolist() if head not in colored_heads]
+        self.wipe_out = len(self.wiped_heads) > 0
+        self.last_affected = affected
+
+    def undo(self, cells, board):
+        """
+        Undo apply(cells, ...).
+        :param board: The board from before the cells were colored, the index matches it from now on.
+        """
+        path_ids, counts = self.get_covering_paths(cells)
+        self.unblock(path_ids, counts)
+        self.board = board
+        self.wipe_out = False
+        self.wiped_heads = []
+
+    def block(self, path_ids, counts=1):
+        """
+        Block the paths, as if 'counts' more of their cells were colored.
+        :param path_ids: Array of path ids, without repeats
+        :return: Array of the head ids that lost valid paths
+        """
+        newly_blocked = path_ids[self.blocked[path_ids] == 0]
+        self.blocked[path_ids] += counts
+        lost = np.bincount(self.path_heads[newly_blocked], minlength=len(self.live_counts)).astype(np.int32)
+        self.live_counts -= lost
+        return np.flatnonzero(lost)
+
+    def unblock(self, path_ids, counts=1):
+        """
+        Undo block(path_ids, counts).
+        """
+        self.blocked[path_ids] -= counts
+        unblocked = path_ids[self.blocked[path_ids] == 0]
+        self.live_counts += np.bincount(self.path_heads[unblocked],
+                                        minlength=len(self.live_counts)).astype(np.int32)
+
+    # *** Getters *** #
+    def is_indexed(self, x, y):
+        """
+        :return: True if the head (x, y) is in the index, else False
+        """
+        return (x, y) in self.heads
+
+    def get_moves(self, x, y):
+        """
+        :return: The valid paths of the head (x, y), in the order of its possible paths
+        """
+        path_ids = self.head_paths[self.heads[(x, y)]]
+        return [self.get_path(path_id) for path_id in path_ids[self.blocked[path_ids] == 0].tolist()]
+
+    def count_moves(self, x, y):
+        """
+        :return: The number of valid paths of the head (x, y)
+        """
+        return int(self.live_counts[self.heads[(x, y)]])
+
+    def get_path(self, path_id):
+        """
+        :return: The path as a list of cells (x, y)
+        """
+        return [divmod(cell, self.width) for cell in self.get_path_cells(path_id).tolist()]
+
+    def get_path_cells(self, path_id):
+        """
+        :return: The flat cells (x * board_w + y) of the path (a view, no copy)
+        """
+        return self.path_cells[self.path_offsets[path_id]:self.path_offsets[path_id + 1]]
+
+    def get_cell_paths(self, cell):
+        """
+        :param cell: Flat cell (x * board_w + y)
+        :return: The ids of the paths that cover the cell (a view, no copy)
+        """
+        return self.cell_path_ids[self.cell_offsets[cell]:self.cell_offsets[cell + 1]]
+
+    def get_common_cells(self, head_id):
+        """
+        :return: The cells (x, y) that all the valid paths of the head cover
+        """
+        cells, count = self.get_live_path_cells(head_id)
+        if count == 0:
+            return []
+
+        # Count the paths that cover each cell. Paths don't cover a cell twice
+        covers = np.bincount(cells, minlength=self.size)
+        return [divmod(int(cell), self.width) for cell in np.flatnonzero(covers == count)]
+
+    def get_live_path_cells(self, head_id):
+        """
+        :return: The flat cells (x * board_w + y) of all the valid paths of the head, path after path, and the number
+                 of valid paths
+        """
+        path_ids = self.head_paths[head_id]
+        path_ids = path_ids[self.blocked[path_ids] == 0]
+        return self.get_paths_cells(path_ids)[0], len(path_ids)
+
+    def get_paths_cells(self, path_ids):
+        """
+        :param path_ids: Array of path ids
+        :return: The flat cells (x * board_w + y) of the paths, path after path, and the index in the cells where
+                 each path starts
+        """
+        if len(path_ids) == 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+
+        starts = self.path_offsets[path_ids]
+        lengths = self.path_offsets[path_ids + 1] - starts
+        segments = np.zeros(len(path_ids), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=segments[1:])
+        gather = np.repeat(starts - segments, lengths) + np.arange(segments[-1] + lengths[-1])
+        return self.path_cells[gather], segments
+
+    def explain_blocked_paths(self, head_id, cell_levels):
+        """
+        Explain why the paths of the head are not valid: a blocked path is explained by the colored cell of the path
+        that was colored first.
+        :param cell_levels: int32 array, the level (search depth) that colored each flat cell, -1 for empty cells
+        :return: Set of the levels that explain the blocked paths of the head
+        """
+        path_ids = self.head_paths[head_id]
+        cells, segments = self.get_paths_cells(path_ids[self.blocked[path_ids] > 0])
+        if len(cells) == 0:
+            return set()
+
+        levels = cell_levels[cells]
+        levels[levels < 0] = np.iinfo(np.int32).max
+        first_levels = np.minimum.reduceat(levels, segments)
+        return set(np.unique(first_levels[first_levels < np.iinfo(np.int32).max]).tolist())
+
+    def get_components(self, head_ids):
+        """
+        Split the heads into independent components: heads are in the same component if their valid paths can share
+        a cell (union-find over the cells the valid paths cover).
+        :param head_ids: Head ids of heads that are not colored
+        :return: List of components, a component is a list of head ids
+        """
+        parents = {head_id: head_id for head_id in head_ids}
+
+        def find(head_id):
+            while parents[head_id] != head_id:
+                parents[head_id] = parents[parents[head_id]]
+                head_id = parents[head_id]
+            return head_id
+
+        owners = np.full(self.size, -1, dtype=np.int64)
+        for head_id in head_ids:
+            cells = np.unique(self.get_live_path_cells(head_id)[0])
+            cell_owners = owners[cells]
+            for other in np.unique(cell_owners[cell_owners >= 0]).tolist():
+                parents[find(other)] = find(head_id)
+            owners[cells] = head_id
+
+        components = {}
+        for head_id in head_ids:
+            components.setdefault(find(head_id), []).append(head_id)
+        return list(components.values())
+
+    def get_conflicting_paths(self, cell, head_id):
+        """
+        :return: The ids of the paths that cover the cell and don't start or end at the head
+        """
+        path_ids = self.get_cell_paths(cell[0] * self.width + cell[1])
+        return path_ids[(self.path_heads[path_ids] != head_id) & (self.path_ends[path_ids] != head_id)]
@@ -10,11 +10,20 @@ class Game:
     get input/draw output
     """
 
-    def __init__(self, xml_dict):
+    def __init__(self, xml_dict, board_class=Board, cache_domains=False, lazy_domains=None):
         """
         :param xml_dict: dictionary with the following items: Puzzle name, Puzzle width, Puzzle height,
         List of RGB values, paths, lists of lists of paths in the key color
+        :param board_class: The Board backend to use (Board, BitBoard or CompactBoard)
+        :param cache_domains: If True, load the possible paths from the domains cache on disk (built on first use)
+        :param lazy_domains: The smallest number of the heads that search their moves on the current board instead
+                             of keeping all their possible paths (see Board.set_lazy_domains), None for no lazy heads.
+                             Can't be used with cache_domains, which keeps the possible paths of all the heads.
+        :raise ValueError: If both cache_domains and lazy_domains are given
         """
+        if cache_domains and lazy_domains is not None:
+            raise ValueError('lazy_domains can\'t be used with cache_domains')
+
         self.game_name = xml_dict["name"]
 
         self.number_of_colors = len(xml_dict["colors"])
@@ -22,9 +31,16 @@ class Game:
 
         numbers_matrix, coloring_matrix = generate_matrix_from_xml_dict(xml_dict)
 
-        self.board = Board(self.number_of_colors, numbers_matrix)
-        self.initial_board = Board(self.number_of_colors, numbers_matrix)
-        self.goal_board = Board(self.number_of_colors, numbers_matrix, coloring_matrix)
+        self.board = board_class(self.number_of_colors, numbers_matrix)
+        self.initial_board = board_class(self.number_of_colors, numbers_matrix)
+        self.goal_board = board_class(self.number_of_colors, numbers_matrix, coloring_matrix)
+
+        if cache_domains:
+            self.board.compact_domains(use_cache=True)
+            self.initial_board.compact_domains(use_cache=True)
+        if lazy_domains is not None:
+            self.board.set_lazy_domains(lazy_domains)
+            self.initial_board.set_lazy_domains(lazy_domains)
 
         self.search = None
         self.variable_selection = None
@@ -32,6 +48,9 @@ class Game:
 
         self.moves_counter = 0
 
+        # Counters the search reports, e.g. the deductions of the CSP propagation
+        self.search_stats = {}
+
         # Filled only when used
         self.boards_generator = None
 
@@ -40,7 +59,7 @@ class Game:
         prints the board
         """
         return (f'Search: {self.search}\nHeuristic: {self.heuristic}\nMoves counter: {self.moves_counter}'
-                f'\nBoard:\n{self.board}')
+                f'\nSearch stats: {self.search_stats}\nBoard:\n{self.board}')
 
     def do_move_csp(self):
         """
@@ -119,9 +138,11 @@ class Game:
         self.variable_selection = variable_selection_dict[variable_selection]
         self.heuristic = heuristics_dict[heuristic]
 
+        self.search_stats = {}
         self.boards_generator = self.search(self, self.variable_selection, self.heuristic)
 
     def reset_game(self):
         self.moves_counter = 0
+        self.search_stats = {}
         self.board = copy.copy(self.initial_board)
         self.boards_generator = None
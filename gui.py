@@ -225,12 +225,12 @@ def runGUI(layout):
                 # Select search, we scarified here generality for performance, since this is the core to the search
                 # and we wanted to avoid unnecessary 'if' statements each iteration
                 if values['checkbox_show_animation']:
-                    if values['combo_search'] == 'CSP':
+                    if values['combo_search'].startswith('CSP'):
                         run_paths_based_search_with_animation(window, graph, game)
                     else:
                         run_board_based_search_with_animation(window, graph, game)
                 else:
-                    if values['combo_search'] == 'CSP':
+                    if values['combo_search'].startswith('CSP'):
                         run_paths_based_search_without_animation(window, graph, game)
                     else:
                         run_board_based_search_without_animation(window, graph, game)
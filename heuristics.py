@@ -13,7 +13,30 @@ def invalid_state(board):
     numbered_cells = board.get_list_of_numbered_cells()
 
     for i, j in numbered_cells:
-        if not board.is_colored_cell(i, j) and len(board.get_possible_moves(i, j)) == 0:
+        if not board.is_colored_cell(i, j) and not board.has_any_move(i, j):
+            return float('-inf')
+
+    return 0
+
+
+def forward_check(board):
+    """
+    Same as invalid_state, for a board that was valid before its last path was colored with Board.apply_path.
+    Forward checking: the domain index keeps the number of valid paths of each head up to date, and reports a wipe
+    out if coloring the path left a head without valid paths (it checks only the heads that lost paths).
+    The heads that are not in the index are checked after it.
+    :param board: The current board
+    :return: -infinity if the board is not valid,  else - 0.
+    """
+    index = board.domain_index
+    if index is None or index.board is not board:
+        return invalid_state(board)
+
+    if index.wipe_out:
+        return float('-inf')
+
+    for i, j in index.unindexed_heads:
+        if not board.is_colored_cell(i, j) and not board.has_any_move(i, j):
             return float('-inf')
 
     return 0
@@ -42,14 +65,14 @@ class CountPossiblePaths:
         x, y = path[0]
         end_x, end_y = path[-1]
 
-        start_moves = board.get_possible_moves(x, y)
-        if len(start_moves) == 0:
+        start_moves = board.count_moves(x, y)
+        if start_moves == 0:
             return float('inf')
-        end_moves = board.get_possible_moves(end_x, end_y)
-        if len(end_moves) == 0:
+        end_moves = board.count_moves(end_x, end_y)
+        if end_moves == 0:
             return float('inf')
 
-        return max(len(board.get_possible_moves(x, y)), len(board.get_possible_moves(end_x, end_y)))
+        return max(start_moves, end_moves)
 
 
 class StickToWalls:
@@ -41,7 +41,7 @@ def convert_xml_dict_to_rows(xml_dict):
             ]]
 
     # Get list of wrong paths, score them 0
-    game = Game(xml_dict)
+    game = Game(xml_dict, cache_domains=True)
     for cell in game.initial_board.get_list_of_numbered_cells():
         paths = game.board.get_possible_moves(cell[0], cell[1])
         for path in paths:
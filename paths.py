@@ -0,0 +1,365 @@
+import os
+import pickle
+from collections import Counter
+from functools import lru_cache
+
+PATH_TO_SHAPES = './cache/shapes'
+SHAPES_VERSION = 1  # Change when the rules of the shapes change, so old shape files are not used
+SHAPE_LIBRARY_MAX_LENGTH = 8  # Longer paths have too many shapes, they are searched on the board itself
+BIDIRECTIONAL_MIN_LENGTH = 14  # Default length from which paths are searched from both ends (see Board.get_paths)
+UNREACHABLE = 255  # Distance of cells that can't be reached (see find_distance_field)
+
+# Shapes that were already loaded or found, {length: {(end_dx, end_dy): [(shape, bounds), ...]}}
+shapes_library = {}
+
+
+@lru_cache(maxsize=None)
+def get_neighbors_table(width, height):
+    """
+    Precompute the neighbors of every cell of a (w*h) board.
+    Cell (x, y) is represented by the flat index x * width + y.
+    :return: Tuple of tuples, the neighbors of each cell in the order (x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1),
+             skipping cells that are out of the board
+    """
+    neighbors = []
+    for x in range(height):
+        for y in range(width):
+            cell_neighbors = []
+            for n_x, n_y in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+                if 0 <= n_x < height and 0 <= n_y < width:
+                    cell_neighbors.append(n_x * width + n_y)
+            neighbors.append(tuple(cell_neighbors))
+    return tuple(neighbors)
+
+
+def find_distance_field(width, height, walls, target, max_distance):
+    """
+    Find the distance of every cell from target, going only through cells that are not walls (breadth first search).
+    Since the numbered cells are walls, this is the real number of steps a path needs to get to target, which can be
+    much more than the manhattan distance.
+    :param walls: bytearray (size w*h), non-zero for cells the path can't pass through (the numbered cells).
+    :param target: Target cell (x, y).
+    :param max_distance: Cells farther than this are not searched.
+    :return: bytearray (size w*h), the distance of each cell from target (cell (x, y) is x * width + y).
+             UNREACHABLE for walls and for cells farther than max_distance.
+    """
+    neighbors = get_neighbors_table(width, height)
+    distances = bytearray([UNREACHABLE]) * (width * height)
+    target_cell = target[0] * width + target[1]
+
+    distances[target_cell] = 0
+    frontier = [target_cell]
+    for distance in range(1, min(max_distance, UNREACHABLE - 1) + 1):
+        next_frontier = []
+        for cell in frontier:
+            for step in neighbors[cell]:
+                if distances[step] == UNREACHABLE and not walls[step]:
+                    distances[step] = distance
+                    next_frontier.append(step)
+
+        if not next_frontier:
+            break
+        frontier = next_frontier
+
+    return distances
+
+
+def find_walks(width, height, walls, start, end, length, distances=None):
+    """
+    Find all the paths of 'length' cells from start to end that don't visit the same cell twice.
+    Iterative depth first search with an explicit stack: the path is kept in a single buffer that is changed in
+    place, and copied only when a complete path is found.
+    :param width: Board width.
+    :param height: Board height.
+    :param walls: bytearray (size w*h), non-zero for cells the path can't pass through (the numbered cells).
+                  The start and the end may be walls.
+    :param start: Start cell (x, y).
+    :param end: End cell (x, y).
+    :param length: Number of cells in the path, including start and end.
+    :param distances: Distance field of end (see find_distance_field). Found here if not given.
+    :return: List of paths. Path is a list of cells (x, y).
+    """
+    neighbors = get_neighbors_table(width, height)
+    end_x, end_y = end
+    if distances is None:
+        distances = find_distance_field(width, height, walls, end, length - 1)
+
+    end_cell = end_x * width + end_y
+    start_cell = start[0] * width + start[1]
+    last = length - 1
+
+    paths = []
+    if abs(start[0] - end_x) + abs(start[1] - end_y) > last:
+        return paths
+
+    visited = bytearray(width * height)
+    path = [0] * length  # Cells of the current path
+    next_neighbor = [0] * length  # Index of the next neighbor to try, for each cell in path
+
+    path[0] = start_cell
+    visited[start_cell] = 1
+    depth = 0
+
+    while depth >= 0:
+        cell = path[depth]
+        cell_neighbors = neighbors[cell]
+        i = next_neighbor[depth]
+
+        # All the neighbors were tried, go back one step
+        if i == len(cell_neighbors):
+            visited[cell] = 0
+            depth -= 1
+            continue
+
+        next_neighbor[depth] = i + 1
+        step = cell_neighbors[i]
+        if visited[step]:
+            continue
+
+        steps = last - depth - 1  # Steps left after this step
+        if steps == 0:
+            # Last step must get to the end
+            if step == end_cell:
+                path[last] = step
+                paths.append([(path_cell // width, path_cell % width) for path_cell in path])
+            continue
+
+        # If we got to a number (the end is also a number) or the end is too far, don't continue in this direction
+        if walls[step] or distances[step] > steps:
+            continue
+
+        depth += 1
+        path[depth] = step
+        next_neighbor[depth] = 0
+        visited[step] = 1
+
+    return paths
+
+
+def find_half_walks(width, height, walls, start, target, half_length, length, distances):
+    """
+    Find the first 'half_length' cells of all the paths of 'length' cells from start to target, in the same way
+    find_walks does. All the cells after the start must be between the ends of the path, so none of them can be a
+    wall.
+    :param distances: Distance field of target (see find_distance_field).
+    :return: List of halves. Half is a tuple of flat cells (x * width + y).
+    """
+    neighbors = get_neighbors_table(width, height)
+    start_cell = start[0] * width + start[1]
+    last = length - 1
+    half_last = half_length - 1
+
+    halves = []
+    visited = bytearray(width * height)
+    path = [0] * half_length
+    next_neighbor = [0] * half_length
+
+    path[0] = start_cell
+    visited[start_cell] = 1
+    depth = 0
+
+    while depth >= 0:
+        cell = path[depth]
+        cell_neighbors = neighbors[cell]
+        i = next_neighbor[depth]
+
+        if i == len(cell_neighbors):
+            visited[cell] = 0
+            depth -= 1
+            continue
+
+        next_neighbor[depth] = i + 1
+        step = cell_neighbors[i]
+        if visited[step] or walls[step] or distances[step] > last - depth - 1:
+            continue
+
+        if depth + 1 == half_last:
+            path[half_last] = step
+            halves.append(tuple(path))
+            continue
+
+        depth += 1
+        path[depth] = step
+        next_neighbor[depth] = 0
+        visited[step] = 1
+
+    return halves
+
+
+def find_walks_bidirectional(width, height, walls, start, end, length, distances=None, start_distances=None):
+    """
+    Same as find_walks, but meets in the middle: the first half of the paths is searched from the start, the second
+    half is searched (backwards) from the end, and halves that meet at the same middle cell without sharing any other
+    cell are joined. Both halves are about half the length of the path, which is much cheaper to search for long
+    paths. Paths are returned in the same order find_walks finds them.
+    :param length: Number of cells in the path, must be at least 3.
+    :param distances: Distance field of end (see find_distance_field). Found here if not given.
+    :param start_distances: Distance field of start. Found here if not given.
+    :return: List of paths. Path is a list of cells (x, y).
+    """
+    if distances is None:
+        distances = find_distance_field(width, height, walls, end, length - 1)
+    if start_distances is None:
+        start_distances = find_distance_field(width, height, walls, start, length - 1)
+
+    middle = (length - 1) // 2
+    first_halves = find_half_walks(width, height, walls, start, end, middle + 1, length, distances)
+    second_halves = find_half_walks(width, height, walls, end, start, length - middle, length, start_distances)
+
+    # Group the second halves by their middle cell
+    by_middle = {}
+    for half in second_halves:
+        mask = 0
+        for cell in half[:-1]:
+            mask |= 1 << cell
+        by_middle.setdefault(half[-1], []).append((mask, half[-2::-1]))
+
+    # find_walks tries the steps in the order (x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)
+    step_order = {width: 0, -width: 1, 1: 2, -1: 3}
+
+    paths = []
+    for half in first_halves:
+        mask = 0
+        for cell in half:
+            mask |= 1 << cell
+
+        joined = [half + second_half for second_mask, second_half in by_middle.get(half[-1], ())
+                  if not mask & second_mask]
+        if len(joined) > 1:
+            joined.sort(key=lambda path: [step_order[path[i + 1] - path[i]] for i in range(middle, length - 1)])
+
+        for path in joined:
+            paths.append([(cell // width, cell % width) for cell in path])
+
+    return paths
+
+
+def remove_duplicate_footprints(paths):
+    """
+    Remove paths with the same footprint (set of cells). The board must have only 1 solution, so if 2 or more paths
+    cover the same cells in different order, all of them must be invalid (Assume one of them is the right path =>
+    => The other is also valid => There is more than one solution to the board).
+    Paths are grouped by footprint in a single pass, so this runs in linear time.
+    :param paths: List of paths between the same 2 heads.
+    :return: List of the paths with a unique footprint, in the same order.
+    """
+    footprints = [frozenset(path) for path in paths]
+    counter = Counter(footprints)
+    return [path for path, footprint in zip(paths, footprints) if counter[footprint] == 1]
+
+
+def find_shapes(length):
+    """
+    Find all the shapes of paths of 'length' cells on an empty board with no walls. A shape is a path that starts at
+    (0, 0), so every path on a board is a shape moved to its start cell.
+    Shapes with the same footprint are removed (see remove_duplicate_footprints).
+    :param length: Number of cells in the path.
+    :return: Dictionary {(end_dx, end_dy): [(shape, bounds), ...]}, where shape is a tuple of cells (dx, dy) and
+             bounds is (min_dx, max_dx, min_dy, max_dy). Shapes are in the same order find_walks finds them.
+    """
+    # Board big enough for any path of this length that starts at the center
+    size = 2 * length - 1
+    center = length - 1
+    neighbors = get_neighbors_table(size, size)
+    last = length - 1
+
+    shapes = {}
+    visited = bytearray(size * size)
+    path = [0] * length
+    next_neighbor = [0] * length
+
+    path[0] = center * size + center
+    visited[path[0]] = 1
+    depth = 0
+
+    while depth >= 0:
+        cell = path[depth]
+        cell_neighbors = neighbors[cell]
+        i = next_neighbor[depth]
+
+        if i == len(cell_neighbors) or depth == last:
+            visited[cell] = 0
+            depth -= 1
+            continue
+
+        next_neighbor[depth] = i + 1
+        step = cell_neighbors[i]
+        if visited[step]:
+            continue
+
+        depth += 1
+        path[depth] = step
+        next_neighbor[depth] = 0
+        visited[step] = 1
+
+        if depth == last:
+            shape = tuple((path_cell // size - center, path_cell % size - center) for path_cell in path)
+            shapes.setdefault(shape[-1], []).append(shape)
+
+    library = {}
+    for end, end_shapes in shapes.items():
+        library[end] = [(shape, (min(dx for dx, dy in shape), max(dx for dx, dy in shape),
+                                 min(dy for dx, dy in shape), max(dy for dx, dy in shape)))
+                        for shape in remove_duplicate_footprints(end_shapes)]
+    return library
+
+
+def get_shapes(length, end_dx, end_dy):
+    """
+    Get the shapes of paths of 'length' cells that end at (end_dx, end_dy) (see find_shapes).
+    The shapes of each length are found once, and saved to PATH_TO_SHAPES so other runs can load them. The files
+    are named and tagged with SHAPES_VERSION, files of another version are found again.
+    :return: List of (shape, bounds)
+    """
+    if length not in shapes_library:
+        file_path = f'{PATH_TO_SHAPES}/shapes_v{SHAPES_VERSION}_{length}.pickle'
+        if os.path.exists(file_path):
+            with open(file_path, 'rb') as file:
+                version, library = pickle.load(file)
+            if version == SHAPES_VERSION:
+                shapes_library[length] = library
+
+        if length not in shapes_library:
+            shapes_library[length] = find_shapes(length)
+
+            # Write to a temporary file first, so other processes never read half a file
+            os.makedirs(PATH_TO_SHAPES, exist_ok=True)
+            with open(f'{file_path}.{os.getpid()}', 'wb') as file:
+                pickle.dump((SHAPES_VERSION, shapes_library[length]), file)
+            os.replace(f'{file_path}.{os.getpid()}', file_path)
+
+    return shapes_library[length].get((end_dx, end_dy), [])
+
+
+@lru_cache(maxsize=None)
+def get_board_shapes(length, end_dx, end_dy, width):
+    """
+    Get the shapes of get_shapes(length, end_dx, end_dy), with the cells between the ends also given as offsets of
+    flat cell indices on a board of the given width (cell (x, y) is x * width + y).
+    :return: List of (shape, bounds, inner_offsets)
+    """
+    return [(shape, bounds, tuple(dx * width + dy for dx, dy in shape[1:-1]))
+            for shape, bounds in get_shapes(length, end_dx, end_dy)]
+
+
+def find_walks_from_shapes(width, height, walls, start, end, length):
+    """
+    Same as find_walks followed by remove_duplicate_footprints, but made by moving the shapes from the shapes library
+    to the start cell, and keeping the shapes that are on the board and don't pass through walls.
+    :return: List of paths. Path is a list of cells (x, y).
+    """
+    x, y = start
+    start_cell = x * width + y
+    paths = []
+    for shape, (min_dx, max_dx, min_dy, max_dy), inner_offsets in \
+            get_board_shapes(length, end[0] - x, end[1] - y, width):
+        if x + min_dx < 0 or height <= x + max_dx or y + min_dy < 0 or width <= y + max_dy:
+            continue
+
+        for offset in inner_offsets:
+            if walls[start_cell + offset]:
+                break
+        else:
+            paths.append([(x + dx, y + dy) for dx, dy in shape])
+
+    return paths
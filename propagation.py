@@ -0,0 +1,296 @@
+import numpy as np
+
+COMMON_CELLS_MAX_PATHS = 256  # Heads with more valid paths than this rarely have common cells, and are not checked
+ARC_CONSISTENCY_MAX_PATHS = 64  # Arcs are revised only toward heads with at most this many valid paths
+
+
+class Propagator:
+    """
+    Propagates the forced deductions of the CSP on the board the search runs on, using its DomainIndex
+    (see Board.build_domain_index):
+    - A head with a single valid path (including heads of number 1) must take it, so the path is colored.
+    - The cells that all the valid paths of a head cover must be colored by that head, so they are reserved for it:
+      the paths of other heads that cover them are blocked.
+    - Optionally, arc consistency (AC-3) between pairs of heads whose paths share cells: a path that overlaps all
+      the valid paths of another head can't be part of a solution, so it is blocked (see revise).
+    Deductions are run to a fixpoint, and undone when the search backtracks (see mark and undo).
+
+    The Propagator stores:
+    - board: the board of the search
+    - index: the DomainIndex of the board
+    - stats: dictionary of the number of deductions made: forced paths, reserved cells and pruned paths
+    - reserved: dictionary {cell (x, y): head id}, the reserved cells
+    - trail: list of the deductions, newest last. ('path', path) for a colored path, ('reserve', cell, path ids)
+             for a reserved cell and the paths it blocked, ('remove', path ids) for paths removed by arc consistency
+    - arc_consistency: True to run AC-3 after the other deductions
+    - cell_masks: dictionary {head id: {flat cell: bitset}}, bit i of the bitset is set if the i-th path of the
+                  head covers the cell (see get_cell_masks)
+    - neighbors: dictionary {head id: list of head ids}, the heads whose paths share cells with the head's paths
+    - reverse_paths: dictionary {head id: {path (tuple of flat cells): path id}}, to find the same path from the
+                     other head
+    """
+
+    def __init__(self, board, stats, arc_consistency=False):
+        """
+        :param board: The board of the search, with a domain index
+        :param stats: Dictionary to count the deductions (and the search nodes) in
+        :param arc_consistency: If True, also make the domains arc consistent (AC-3)
+        """
+        self.board = board
+        self.index = board.domain_index
+        self.stats = stats
+        for key in ('nodes', 'forced paths', 'reserved cells', 'pruned paths'):
+            self.stats.setdefault(key, 0)
+
+        self.reserved = {}
+        self.trail = []
+
+        self.arc_consistency = arc_consistency
+        if arc_consistency:
+            self.stats.setdefault('arc pruned paths', 0)
+        self.cell_masks = {}
+        self.neighbors = {}
+        self.reverse_paths = {}
+
+    def mark(self):
+        """
+        :return: Mark of the current deductions, to undo the deductions made after it (see undo)
+        """
+        return len(self.trail)
+
+    def record_path(self, path):
+        """
+        Record a path that the search colored (with Board.apply_path), so undo removes it with the deductions made
+        after it.
+        """
+        self.trail.append(('path', path))
+
+    def propagate(self, heads=None):
+        """
+        Run the deductions to a fixpoint. Only heads whose valid paths changed can have new deductions, so the heads
+        that lost paths are checked after each deduction.
+        Generator, yields (board, path, color) for each path it colors (the board is already colored).
+        :param heads: Head ids (of the index) to check first, all the heads if None
+        :return: False if a head that isn't colored was left without valid paths, else True
+        """
+        board, index = self.board, self.index
+        self.stats['nodes'] += 1
+        queue = list(range(len(index.head_cells))) if heads is None else [int(head) for head in heads]
+        queued = set(queue)
+        changed = set(queue)  # Heads whose paths changed, their arcs are revised (arc consistency)
+
+        while queue or changed and self.arc_consistency:
+            if not queue:
+                affected = self.make_arc_consistent(changed)
+                changed = set()
+                if affected is None:
+                    return False
+                queue = list(affected)
+                queued = set(queue)
+                continue
+
+            head_id = queue.pop()
+            queued.discard(head_id)
+            x, y = index.head_cells[head_id]
+            if board.is_colored_cell(x, y):
+                continue
+
+            count = index.live_counts[head_id]
+            if count == 0:
+                return False
+
+            if count == 1:
+                path = index.get_moves(x, y)[0]
+                color = board.get_number_color_in_cell(x, y)
+                board.apply_path(path, color)
+                self.trail.append(('path', path))
+                self.stats['forced paths'] += 1
+                yield board, path, color
+
+                if index.wipe_out:
+                    return False
+                affected = index.last_affected
+            elif count <= COMMON_CELLS_MAX_PATHS:
+                affected = self.reserve_common_cells(head_id)
+            else:
+                continue
+
+            for head in affected:
+                head = int(head)
+                changed.add(head)
+                if head not in queued:
+                    queue.append(head)
+                    queued.add(head)
+
+        # Heads that are not in the index are only checked
+        for x, y in index.unindexed_heads:
+            if not board.is_colored_cell(x, y) and not board.has_any_move(x, y):
+                return False
+
+        return True
+
+    def reserve_common_cells(self, head_id):
+        """
+        Reserve the cells that all the valid paths of the head cover, and block the paths of other heads that
+        cover them.
+        :return: List of the head ids that lost valid paths
+        """
+        affected = []
+        for cell in self.index.get_common_cells(head_id):
+            if cell in self.reserved or cell == self.index.head_cells[head_id]:
+                continue
+
+            path_ids = self.index.get_conflicting_paths(cell, head_id)
+            self.stats['pruned paths'] += int((self.index.blocked[path_ids] == 0).sum())
+            affected.extend(self.index.block(path_ids))
+
+            self.reserved[cell] = head_id
+            self.trail.append(('reserve', cell, path_ids))
+            self.stats['reserved cells'] += 1
+
+        return affected
+
+    # *** Arc consistency *** #
+    def make_arc_consistent(self, heads):
+        """
+        AC-3 on the arcs toward the given heads: revise the arcs (A, B) for every neighbor A of a head B, and the
+        arcs toward A whenever A loses paths, until no arc removes paths.
+        :param heads: Head ids whose paths changed
+        :return: Set of the head ids that lost paths, None if a head was left without valid paths
+        """
+        index = self.index
+        arcs = [(head_a, head_b) for head_b in heads if self.is_small_domain(head_b)
+                for head_a in self.get_neighbors(head_b)]
+        queued = set(arcs)
+        affected = set()
+
+        while arcs:
+            arc = arcs.pop()
+            queued.discard(arc)
+            head_a, head_b = arc
+            if self.is_colored_head(head_a) or self.is_colored_head(head_b):
+                continue
+
+            removed = self.revise(head_a, head_b)
+            if not removed:
+                continue
+
+            path_ids = np.array(removed, dtype=np.int32)
+            self.stats['arc pruned paths'] += len(removed)
+            index.block(path_ids)
+            self.trail.append(('remove', path_ids))
+            affected.add(head_a)
+            if index.live_counts[head_a] == 0:
+                return None
+
+            if self.is_small_domain(head_a):
+                for head_c in self.get_neighbors(head_a):
+                    if head_c != head_b and (head_c, head_a) not in queued:
+                        arcs.append((head_c, head_a))
+                        queued.add((head_c, head_a))
+
+        return affected
+
+    def revise(self, head_a, head_b):
+        """
+        Find the valid paths of head A that have no compatible valid path of head B. Paths are compatible if they
+        don't share cells, or if they are the same path between A and B (once from each end).
+        :return: List of the path ids of A to remove
+        """
+        index = self.index
+        b_paths = index.head_paths[head_b]
+        if len(b_paths) == 0:
+            return []
+
+        first_b = int(b_paths[0])
+        live_b = self.get_live_mask(head_b)
+        cell_masks = self.get_cell_masks(head_b)
+
+        removed = []
+        a_paths = index.head_paths[head_a]
+        for path_id in a_paths[index.blocked[a_paths] == 0].tolist():
+            cells = index.get_path_cells(path_id).tolist()
+            if index.path_ends[path_id] == head_b:
+                # Every other path of B covers the head B too
+                reverse_id = self.get_reverse_paths(head_b).get(tuple(cells[::-1]))
+                supported = reverse_id is None or live_b >> (reverse_id - first_b) & 1
+            else:
+                conflicts = 0
+                for cell in cells:
+                    conflicts |= cell_masks.get(cell, 0)
+                supported = live_b & ~conflicts
+
+            if not supported:
+                removed.append(path_id)
+
+        return removed
+
+    def is_colored_head(self, head_id):
+        x, y = self.index.head_cells[head_id]
+        return self.board.is_colored_cell(x, y)
+
+    def is_small_domain(self, head_id):
+        """
+        :return: True if the head has few enough valid paths to revise the arcs toward it
+        """
+        return self.index.live_counts[head_id] <= ARC_CONSISTENCY_MAX_PATHS
+
+    def get_live_mask(self, head_id):
+        """
+        :return: Bitset of the valid paths of the head, bit i for its i-th path
+        """
+        path_ids = self.index.head_paths[head_id]
+        live = np.packbits(self.index.blocked[path_ids] == 0, bitorder='little')
+        return int.from_bytes(live.tobytes(), 'little')
+
+    def get_cell_masks(self, head_id):
+        """
+        :return: Dictionary {flat cell (x * board_w + y): bitset of the paths of the head (bit i for its i-th path)
+                 that cover it}
+        """
+        if head_id not in self.cell_masks:
+            cell_masks = {}
+            for i, path_id in enumerate(self.index.head_paths[head_id].tolist()):
+                for cell in self.index.get_path_cells(path_id).tolist():
+                    cell_masks[cell] = cell_masks.get(cell, 0) | 1 << i
+            self.cell_masks[head_id] = cell_masks
+
+        return self.cell_masks[head_id]
+
+    def get_neighbors(self, head_id):
+        """
+        :return: List of the other heads that have paths which share cells with the paths of the head
+        """
+        if head_id not in self.neighbors:
+            covering = [self.index.get_cell_paths(cell) for cell in self.get_cell_masks(head_id)]
+            heads = np.unique(self.index.path_heads[np.concatenate(covering)]) if covering else []
+            self.neighbors[head_id] = [int(head) for head in heads if head != head_id]
+
+        return self.neighbors[head_id]
+
+    def get_reverse_paths(self, head_id):
+        """
+        :return: Dictionary {path (tuple of flat cells): path id} of the paths of the head
+        """
+        if head_id not in self.reverse_paths:
+            self.reverse_paths[head_id] = {tuple(self.index.get_path_cells(path_id).tolist()): path_id
+                                           for path_id in self.index.head_paths[head_id].tolist()}
+
+        return self.reverse_paths[head_id]
+
+    def undo(self, mark):
+        """
+        Undo the deductions made after the mark (see mark).
+        Generator, yields (board, path, 0) for each colored path it removes.
+        """
+        while len(self.trail) > mark:
+            deduction = self.trail.pop()
+            if deduction[0] == 'path':
+                self.board.undo_path()
+                yield self.board, deduction[1], 0
+            elif deduction[0] == 'reserve':
+                _, cell, path_ids = deduction
+                self.index.unblock(path_ids)
+                del self.reserved[cell]
+            else:
+                self.index.unblock(deduction[1])
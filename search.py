@@ -1,7 +1,10 @@
 import copy
 
+import numpy as np
+
 import util
-from heuristics import invalid_state
+from heuristics import forward_check, invalid_state
+from propagation import Propagator
 
 
 def calc_board_cost(board):
@@ -20,7 +23,7 @@ def a_star_search(game, variable_selection, HeuristicClass):
     Search the node that has the lowest combined cost and heuristic first.
     """
     heuristic = HeuristicClass()
-    explored = set()
+    explored = set()  # Zobrist keys of the explored boards
     queue = util.PriorityQueue()
     queue.push(game.get_initial_board(), 0)
 
@@ -34,12 +37,12 @@ def a_star_search(game, variable_selection, HeuristicClass):
         successor = get_successors(current_board)
 
         for next_board, next_path in successor:
-            if next_board not in explored:
+            if next_board.zobrist_key not in explored:
                 total_cost = calc_board_cost(next_board) + heuristic.cost(next_board, next_path)
                 if total_cost > float('-inf'):
                     queue.push(next_board, total_cost)
 
-        explored.add(current_board)
+        explored.add(current_board.zobrist_key)
 
     # yield None
 
@@ -60,10 +63,9 @@ def get_successors(board):
     for i, j in numbered_cells:
         paths = board.get_possible_moves(i, j)
         for path in paths:
-            current_board = copy.copy(board)
-            color = current_board.get_number_color_in_cell(path[0][0], path[0][1])
-            current_board.set_cells_coloring(path, color)
-            successors += [(current_board, path)]
+            # Successors share the rows the path doesn't cover with the board (see Board.get_successor)
+            color = board.get_number_color_in_cell(path[0][0], path[0][1])
+            successors += [(board.get_successor(path, color), path)]
     return successors
 
 
@@ -72,7 +74,7 @@ def breadth_first_search(game, variable_selection, heuristic):
     """
     Search the shallowest nodes in the search tree first.
     """
-    explored = set()
+    explored = set()  # Zobrist keys of the explored boards
     queue = util.Queue()
     queue.push(game.get_initial_board())
 
@@ -85,10 +87,10 @@ def breadth_first_search(game, variable_selection, heuristic):
 
         successor = get_successors(current_board)
         for next_board, next_path in successor:
-            if next_board not in explored:
+            if next_board.zobrist_key not in explored:
                 queue.push(next_board)
 
-        explored.add(current_board)
+        explored.add(current_board.zobrist_key)
 
     # yield None
 
@@ -98,7 +100,7 @@ def depth_first_search(game, variable_selection, heuristic):
     """
     Search the shallowest nodes in the search tree first.
     """
-    explored = set()
+    explored = set()  # Zobrist keys of the explored boards
     stack = util.Stack()
     stack.push(game.get_initial_board())
 
@@ -111,10 +113,10 @@ def depth_first_search(game, variable_selection, heuristic):
 
         successor = get_successors(current_board)
         for next_board, next_path in successor:
-            if next_board not in explored:
+            if next_board.zobrist_key not in explored:
                 stack.push(next_board)
 
-        explored.add(current_board)
+        explored.add(current_board.zobrist_key)
 
     # yield None
 
@@ -124,7 +126,7 @@ def uniform_cost_search(game, variable_selection, heuristic):
     """
     Search the node of least total cost first.
     """
-    explored = set()
+    explored = set()  # Zobrist keys of the explored boards
     queue = util.PriorityQueue()
     queue.push(game.get_initial_board(), 0)
 
@@ -137,17 +139,19 @@ def uniform_cost_search(game, variable_selection, heuristic):
         successor = get_successors(current_board)
 
         for next_board, next_path in successor:
-            if next_board not in explored:
+            if next_board.zobrist_key not in explored:
                 total_cost = calc_board_cost(next_board)
                 queue.push(next_board, total_cost)
 
-        explored.add(current_board)
+        explored.add(current_board.zobrist_key)
 
     # yield None
 
 
 # *** CSP *** #
-def csp(game, VariableSelectionClass, HeuristicClass):
+def csp(game, VariableSelectionClass, HeuristicClass, in_place=True, forward_checking=None, propagation=None,
+        arc_consistency=False, components=False, backjumping=False, nogoods=0, nogoods_replacement='lru',
+        iterative=False, lazy_domains=None):
     """
     Works as follows:
         state - Board state (what cells are filled and with what color). Since there are many invalid board states,
@@ -174,15 +178,373 @@ def csp(game, VariableSelectionClass, HeuristicClass):
     :param heads:
     :param mrv:
     :param lcv:
+    :param in_place: If True, search on a single board that paths are applied to and undone from (see backtrack),
+                     else copy the board for every path (see backtrack_with_copies).
+    :param forward_checking: If True, check the boards with forward checking (see heuristics.forward_check),
+                             else check all the heads of every board (heuristics.invalid_state, the reference check).
+                             Needs in_place. None for True when in_place is True, else False.
+    :param propagation: If True, color forced paths and reserve common cells before the search and after every
+                        path (see propagation.Propagator), and count the deductions in game.search_stats.
+                        Needs in_place, and can't be used with backjumping. None for True when it can be used.
+    :param arc_consistency: If True, the propagation also makes the paths of the heads arc consistent (AC-3).
+                            The number of search nodes is counted in game.search_stats with the deductions, to
+                            measure the pruning. Needs propagation.
+    :param components: If True, split the heads that aren't colored into independent components, and solve each
+                       component on its own (see backtrack_components). Needs propagation, and all the heads in the
+                       domain index (no lazy heads).
+    :param backjumping: If True, search with conflict-directed backjumping on top of forward checking (see
+                        backtrack_cbj), instead of propagation. Needs in_place and forward checking.
+    :param nogoods: The size of the nogood table (see util.NogoodTable), 0 for no table. The Zobrist keys of the
+                    boards whose subtree was searched without reaching the goal are kept, and the search skips boards
+                    with the same key. The hits and misses are counted in game.search_stats.
+                    Needs in_place, and can't be used with components or backjumping.
+    :param nogoods_replacement: The replacement policy of the nogood table, 'lru' or 'depth'.
+    :param iterative: If True, search with an explicit stack instead of recursion (see backtrack_iterative), for
+                      boards with more heads than the recursion limit. Needs in_place, and can't be used with
+                      components or backjumping.
+    :param lazy_domains: The smallest number of the heads that search their moves on the current board instead of
+                         keeping all their possible paths (see Board.set_lazy_domains), None to keep the setting of
+                         the initial board. Lazy heads are not in the domain index, so it can't be used with
+                         components.
     :return:
+    :raise ValueError: If the options can't be used together
     """
+    if forward_checking is None:
+        forward_checking = in_place
+    if propagation is None:
+        propagation = in_place and not backjumping
+
+    # Options are never dropped, a combination that the search can't run is an error
+    if not in_place and (forward_checking or propagation or backjumping or nogoods or iterative):
+        raise ValueError('forward_checking, propagation, backjumping, nogoods and iterative need in_place')
+    if backjumping and (propagation or not forward_checking):
+        raise ValueError('backjumping runs on forward checking, without propagation')
+    if (arc_consistency or components) and not propagation:
+        raise ValueError('arc_consistency and components need propagation')
+    if (components or backjumping) and (nogoods or iterative):
+        raise ValueError('nogoods and iterative can\'t be used with components or backjumping')
+    if nogoods_replacement not in ('lru', 'depth'):
+        raise ValueError(f'Unknown nogoods replacement policy: {nogoods_replacement}')
+
     board = game.get_initial_board()
+    if in_place or lazy_domains is not None:
+        # The search changes the board, keep the initial board as it is
+        board = copy.copy(board)
+    if lazy_domains is not None:
+        board.set_lazy_domains(lazy_domains)
+    board.build_domain_index()
+    if components and board.domain_index.unindexed_heads:
+        raise ValueError('components needs all the heads in the domain index (no lazy heads)')
     variable_selection_object = VariableSelectionClass(board)
     heuristic_object = HeuristicClass(board)
-    return backtrack(board, variable_selection_object, heuristic_object)
 
+    if backjumping:
+        game.search_stats.update({'nodes': 0, 'backjumps': 0})
+        cell_levels = np.full(board.get_width() * board.get_height(), -1, dtype=np.int32)
+        return backtrack_cbj(board, variable_selection_object, heuristic_object, game.search_stats, cell_levels)
+
+    if in_place:
+        check_state = forward_check if forward_checking else invalid_state
+        nogood_table = util.NogoodTable(nogoods, nogoods_replacement, game.search_stats) if nogoods > 0 else None
+        if propagation:
+            propagator = Propagator(board, game.search_stats, arc_consistency)
+            return propagate_and_backtrack(board, variable_selection_object, heuristic_object, check_state,
+                                           propagator, components, nogood_table, iterative, game.goal_board)
+        search = backtrack_iterative if iterative else backtrack
+        return search(board, variable_selection_object, heuristic_object, check_state, None, nogood_table)
+    return backtrack_with_copies(board, variable_selection_object, heuristic_object)
+
+
+def iterative_csp(game, VariableSelectionClass, HeuristicClass):
+    """
+    CSP search with the explicit stack backtracking (see csp and backtrack_iterative).
+    """
+    return csp(game, VariableSelectionClass, HeuristicClass, iterative=True)
+
+
+def propagate_and_backtrack(board, variable_selection, heuristic, check_state, propagator, components=False,
+                            nogoods=None, iterative=False, goal_board=None):
+    """
+    Propagate the deductions of the initial board, and then search the rest with backtrack (backtrack_components
+    if components is True, backtrack_iterative if iterative is True).
+    :param goal_board: The goal board, the components are solved toward it (see backtrack_components)
+    """
+    if (yield from propagator.propagate()):
+        if components:
+            yield from backtrack_components(board, variable_selection, heuristic, check_state, propagator,
+                                            goal_board)
+        else:
+            search = backtrack_iterative if iterative else backtrack
+            yield from search(board, variable_selection, heuristic, check_state, propagator, nogoods)
+
+
+def backtrack_components(board, variable_selection, heuristic, check_state, propagator, goal_board, heads=None):
+    """
+    Backtracking search that splits the heads that aren't colored into independent components (heads whose valid
+    paths can't share cells, see DomainIndex.get_components), and solves the components one after the other, the
+    smallest first. A component without a solution fails the branch at once, and a solved component is not searched
+    again. Yields the same kind of (board, path, color) events as backtrack.
+    A component is solved only when its coloring agrees with the goal board (see agrees_with_goal), so when the
+    puzzle has several solutions, the search goes on to the solution of the component that is part of the goal.
+    :param goal_board: The goal board
+    :param heads: Head ids (of the domain index) to color, all the heads if None
+    :return: True if all the heads were colored in agreement with the goal (the board keeps the coloring), else
+             False (the board is restored)
+    """
+    index = board.domain_index
+    if heads is None:
+        heads = range(len(index.head_cells))
+    heads = [head for head in heads if not propagator.is_colored_head(head)]
+    if not heads:
+        return agrees_with_goal(board, goal_board)
+
+    split = index.get_components(heads)
+    if len(split) > 1:
+        propagator.stats['component splits'] = propagator.stats.get('component splits', 0) + 1
+        mark = propagator.mark()
+        for component in sorted(split, key=len):
+            if not (yield from backtrack_components(board, variable_selection, heuristic, check_state, propagator,
+                                                    goal_board, component)):
+                yield from propagator.undo(mark)
+                return False
+        return True
+
+    x, y = variable_selection.next_coordinate(board, {index.head_cells[head] for head in heads})
+    color = board.get_number_color_in_cell(x, y)
+
+    paths = board.get_possible_moves(x, y)
+    if len(paths) > 1:
+        paths = sorted(paths, key=lambda path: heuristic.cost(board, path), reverse=False)
+
+    for path in paths:
+        board.apply_path(path, color)
+
+        if check_state(board):
+            board.undo_path()
+            continue
+
+        mark = propagator.mark()
+        propagator.record_path(path)
+        yield board, path, color
+
+        if (yield from propagator.propagate(index.last_affected)) and \
+                (yield from backtrack_components(board, variable_selection, heuristic, check_state, propagator,
+                                                 goal_board, heads)):
+            return True
+
+        # Remove the deductions and the path
+        yield from propagator.undo(mark)
+
+    return False
+
+
+def agrees_with_goal(board, goal_board):
+    """
+    :return: True if every colored cell of the board has the color of the same cell on the goal board. When all the
+             heads are colored, this is the goal check: both boards have the same number of colored cells.
+    """
+    for x in range(board.get_height()):
+        for y in range(board.get_width()):
+            cell_color = board.get_cell_coloring(x, y)
+            if cell_color and cell_color != goal_board.get_cell_coloring(x, y):
+                return False
+    return True
+
+
+def backtrack(board, variable_selection, heuristic, check_state=invalid_state, propagator=None, nogoods=None):
+    """
+    Backtracking search on a single board: each path is colored in place (Board.apply_path) and undone when the
+    search backtracks (Board.undo_path), so a node costs only the writes of its path's cells.
+    Yields the same (board, path, color) events as backtrack_with_copies. The yielded board is always the same
+    object, and shows the state of the search at the time of the event.
+    :param check_state: Function of the board, returns -infinity if the board is not valid (see invalid_state)
+    :param propagator: Propagator of the board, that propagates the deductions of every path (None for no
+                       propagation). Its forced paths are yielded like the paths of the search.
+    :param nogoods: NogoodTable of the Zobrist keys of boards that failed (None for no table). Boards in the table
+                    are skipped like invalid boards.
+    """
+    coordinate = variable_selection.next_coordinate(board)
+    if coordinate is None:
+        # All the heads are colored (by propagation)
+        return
+
+    x, y = coordinate
+    color = board.get_number_color_in_cell(x, y)
+
+    # Get list of all possible paths from the cell. sort next cell using variable selection and paths using heuristic
+    paths = board.get_possible_moves(x, y)
 
-def backtrack(board, variable_selection, heuristic):
+    if len(paths) > 1:
+        paths = sorted(paths, key=lambda path: heuristic.cost(board, path), reverse=False)
+
+    for path in paths:
+        board.apply_path(path, color)
+
+        if check_state(board) or nogoods is not None and nogoods.contains(board.zobrist_key):
+            board.undo_path()
+            continue
+
+        key = board.zobrist_key
+        yield board, path, color
+        if propagator is None:
+            yield from backtrack(board, variable_selection, heuristic, check_state, None, nogoods)
+        else:
+            mark = propagator.mark()
+            if (yield from propagator.propagate(board.domain_index.last_affected)):
+                yield from backtrack(board, variable_selection, heuristic, check_state, propagator, nogoods)
+            yield from propagator.undo(mark)
+
+        # The search came back, so no board under this one is the goal
+        if nogoods is not None:
+            nogoods.add(key, len(board.trail))
+
+        # Return back the old board and the path we deleted
+        board.undo_path()
+        yield board, path, 0
+
+
+def backtrack_iterative(board, variable_selection, heuristic, check_state=invalid_state, propagator=None,
+                        nogoods=None):
+    """
+    The same search as backtrack, with an explicit stack instead of recursion, so the depth of the search is not
+    limited by the recursion limit, and an event is not passed through a generator for every level above it.
+    Yields the same (board, path, color) events as backtrack, in the same order.
+    Every level of the stack is a list [color, paths, path, key, mark]: the color of its head, the iterator of its
+    ordered paths, and the path it colored with the board's Zobrist key and the propagator's mark before its
+    deductions (path is None until a path is colored).
+    """
+    stack = []
+    level = open_level(board, variable_selection, heuristic)
+    if level is not None:
+        stack.append(level)
+
+    while stack:
+        level = stack[-1]
+        color, paths, path, key, mark = level
+        if path is not None:
+            # The search came back to this level, remove its path and the deductions made after it
+            if propagator is not None:
+                yield from propagator.undo(mark)
+            if nogoods is not None:
+                nogoods.add(key, len(board.trail))
+            board.undo_path()
+            level[2] = None
+            yield board, path, 0
+
+        path = next(paths, None)
+        if path is None:
+            stack.pop()
+            continue
+
+        board.apply_path(path, color)
+        if check_state(board) or nogoods is not None and nogoods.contains(board.zobrist_key):
+            board.undo_path()
+            continue
+
+        level[2], level[3] = path, board.zobrist_key
+        yield board, path, color
+        if propagator is not None:
+            level[4] = propagator.mark()
+            if not (yield from propagator.propagate(board.domain_index.last_affected)):
+                continue
+
+        child = open_level(board, variable_selection, heuristic)
+        if child is not None:
+            stack.append(child)
+
+
+def open_level(board, variable_selection, heuristic):
+    """
+    Select the next head of backtrack_iterative and order its paths.
+    :return: New level of the stack (see backtrack_iterative), None if all the heads are colored
+    """
+    coordinate = variable_selection.next_coordinate(board)
+    if coordinate is None:
+        return None
+
+    x, y = coordinate
+    paths = board.get_possible_moves(x, y)
+    if len(paths) > 1:
+        paths = sorted(paths, key=lambda path: heuristic.cost(board, path), reverse=False)
+
+    return [board.get_number_color_in_cell(x, y), iter(paths), None, None, None]
+
+
+def backtrack_cbj(board, variable_selection, heuristic, stats, cell_levels, depth=0):
+    """
+    Backtracking search with conflict-directed backjumping (CBJ), on top of forward checking with the domain index.
+    Every failure records its conflict set, the depths of the paths that caused it: when a head is left without
+    valid paths, each of its paths is blocked by the cell that was colored first (see
+    DomainIndex.explain_blocked_paths). When all the paths of a head fail, the search jumps back straight to the
+    deepest depth in the conflict set, skipping the paths of the depths between.
+    Yields the same (board, path, color) events as backtrack, including (board, path, 0) for every path it removes
+    while jumping back.
+    :param stats: Dictionary to count the search nodes and the backjumps in
+    :param cell_levels: int32 array, the depth of the path that colored each flat cell (x * board_w + y), -1 for
+                        empty cells
+    :param depth: The depth of the search
+    :return: The conflict set of the failure (set of depths)
+    """
+    coordinate = variable_selection.next_coordinate(board)
+    if coordinate is None:
+        # All the heads are colored, but it's not the goal board. Go back chronologically
+        return set(range(depth))
+
+    x, y = coordinate
+    color = board.get_number_color_in_cell(x, y)
+    index = board.domain_index
+    width = board.get_width()
+
+    # The depths that blocked paths of this head are part of the conflict set from the start
+    if index is not None and index.is_indexed(x, y):
+        conflicts = index.explain_blocked_paths(index.heads[(x, y)], cell_levels)
+    else:
+        conflicts = set(range(depth))
+
+    paths = board.get_possible_moves(x, y)
+    if len(paths) > 1:
+        paths = sorted(paths, key=lambda path: heuristic.cost(board, path), reverse=False)
+
+    for path in paths:
+        stats['nodes'] += 1
+        cells = [cell_x * width + cell_y for cell_x, cell_y in path]
+        board.apply_path(path, color)
+        cell_levels[cells] = depth
+
+        if forward_check(board):
+            if index is not None and index.board is board and index.wipe_out:
+                for head_id in index.wiped_heads:
+                    conflicts |= index.explain_blocked_paths(head_id, cell_levels)
+            else:
+                conflicts |= set(range(depth))
+            conflicts.discard(depth)
+
+            cell_levels[cells] = -1
+            board.undo_path()
+            continue
+
+        yield board, path, color
+        child_conflicts = yield from backtrack_cbj(board, variable_selection, heuristic, stats, cell_levels,
+                                                   depth + 1)
+
+        # Return back the old board and the path we deleted
+        cell_levels[cells] = -1
+        board.undo_path()
+        yield board, path, 0
+
+        if depth not in child_conflicts:
+            # This path is not part of the failure, jump back over the other paths of this head
+            stats['backjumps'] += 1
+            return child_conflicts
+        conflicts |= child_conflicts - {depth}
+
+    return conflicts
+
+
+def backtrack_with_copies(board, variable_selection, heuristic):
+    """
+    Backtracking search that copies the board for every path it tries.
+    """
     x, y = variable_selection.next_coordinate(board)
 
     # Get list of all possible paths from the cell. sort next cell using variable selection and paths using heuristic
@@ -190,26 +552,32 @@ def backtrack(board, variable_selection, heuristic):
 
     # variable_selection(board)
     if len(paths) > 1:
-        paths.sort(key=lambda path: heuristic.cost(board, path), reverse=False)
+        paths = sorted(paths, key=lambda path: heuristic.cost(board, path), reverse=False)
 
     for path in paths:
         next_board = copy.copy(board)
         next_board.set_cells_coloring(path, board.get_number_color_in_cell(x, y))
+        if board.domain_index is not None:
+            board.domain_index.apply(path, next_board)
 
         if not invalid_state(next_board):
             yield next_board, path, board.get_number_color_in_cell(x, y)
-            done_board = backtrack(next_board, variable_selection, heuristic)
+            done_board = backtrack_with_copies(next_board, variable_selection, heuristic)
             if done_board is not None:
                 yield from done_board
 
             # Return back the old board and the path we deleted
             yield board, path, 0
 
+        if board.domain_index is not None:
+            board.domain_index.undo(path, board)
+
     # yield from None
 
 
 search_dict = {
     "CSP": csp,
+    "CSP (iterative)": iterative_csp,
     'BFS': breadth_first_search,
     'DFS': depth_first_search,
     'UCS': uniform_cost_search,
@@ -2,6 +2,7 @@ import heapq
 import inspect
 import random
 import sys
+from collections import OrderedDict
 
 
 class Pair(object):
@@ -146,6 +147,75 @@ class PriorityQueueWithFunction(PriorityQueue):
         PriorityQueue.push(self, item, self.priorityFunction(item))
 
 
+class NogoodTable:
+    """
+    A bounded table of the keys of states that are known to fail (nogoods), for example Zobrist keys of boards.
+    When the table is full, a new key replaces an old one by the replacement policy:
+    - 'lru': the least recently used key
+    - 'depth': a key of the deepest state (shallow states failed bigger subtrees, so they are kept). A new key that is
+               deeper than all the keys in the table is not added.
+    Lookups are counted as hits and misses in the stats dictionary.
+    """
+
+    def __init__(self, max_size, replacement='lru', stats=None):
+        """
+        :param max_size: The maximal number of keys in the table
+        :param replacement: 'lru' or 'depth'
+        :param stats: Dictionary to count the hits, misses and hit rate of the lookups in
+        """
+        self.max_size = max_size
+        self.replacement = replacement
+        self.stats = {} if stats is None else stats
+        self.stats.update({'nogood hits': 0, 'nogood misses': 0, 'nogood hit rate': 0.0})
+
+        self.entries = OrderedDict()  # {key: depth}, least recently used first
+        self.depths = {}  # {depth: OrderedDict of the keys of that depth}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def contains(self, key):
+        """
+        Look up a key, and count the lookup as a hit or a miss.
+        :return: True if the key is in the table, else False
+        """
+        hit = key in self.entries
+        if hit:
+            self.stats['nogood hits'] += 1
+            self.entries.move_to_end(key)
+        else:
+            self.stats['nogood misses'] += 1
+        self.stats['nogood hit rate'] = self.stats['nogood hits'] / (self.stats['nogood hits'] +
+                                                                     self.stats['nogood misses'])
+        return hit
+
+    def add(self, key, depth):
+        """
+        Add the key of a state that failed.
+        :param depth: The depth of the state in the search
+        """
+        if key in self.entries or self.max_size <= 0:
+            return
+
+        if len(self.entries) >= self.max_size:
+            if self.replacement == 'depth':
+                deepest = max(self.depths)
+                if depth > deepest:
+                    return
+                old_key, _ = self.depths[deepest].popitem(last=False)
+                del self.entries[old_key]
+            else:
+                old_key, old_depth = self.entries.popitem(last=False)
+                del self.depths[old_depth][old_key]
+                deepest = old_depth
+
+            if not self.depths[deepest]:
+                del self.depths[deepest]
+
+        self.entries[key] = depth
+        self.depths.setdefault(depth, OrderedDict())[key] = None
+
+
 def manhattan_distance(xy1, xy2):
     """Returns the Manhattan distance between points xy1 and xy2"""
     return abs(xy1[0] - xy2[0]) + abs(xy1[1] - xy2[1])
@@ -1,13 +1,17 @@
 from random import sample
 
 
+# Every next_coordinate(board, heads=None) returns the next head that isn't colored, only from the given heads
+# (a set of (x, y)) if they are given, or None if there is no such head
+
+
 class TopToBottom:
     def __init__(self, init_board):
         self.list = init_board.get_list_of_numbered_cells()
 
-    def next_coordinate(self, board=None):
+    def next_coordinate(self, board=None, heads=None):
         for x, y in self.list:
-            if not board.is_colored_cell(x, y):
+            if not board.is_colored_cell(x, y) and (heads is None or (x, y) in heads):
                 return x, y
 
 
@@ -16,30 +20,30 @@ class SmallToBig:
         self.list = sorted(init_board.get_list_of_numbered_cells(),
                            key=lambda cell: init_board.get_number_in_cell(cell[0], cell[1]), reverse=False)
 
-    def next_coordinate(self, board):
+    def next_coordinate(self, board, heads=None):
         """
         Sort the list by number value (from small to big)
         :param board: board object
         :return: doesn't return anything. Sorts the numbered_cells list in the board.
         """
         for x, y in self.list:
-            if not board.is_colored_cell(x, y):
+            if not board.is_colored_cell(x, y) and (heads is None or (x, y) in heads):
                 return x, y
 
 
 class MRV:
     def __init__(self, init_board):
         self.list = sorted(init_board.get_list_of_numbered_cells(),
-                           key=lambda cell: len(init_board.get_possible_moves(cell[0], cell[1])), reverse=True)
+                           key=lambda cell: init_board.count_moves(cell[0], cell[1]), reverse=True)
 
-    def next_coordinate(self, board):
+    def next_coordinate(self, board, heads=None):
         """
         Sort list by amount of possible paths (descending order)
         :param board:
         :return:
         """
         for x, y in self.list:
-            if not board.is_colored_cell(x, y):
+            if not board.is_colored_cell(x, y) and (heads is None or (x, y) in heads):
                 return x, y
 
 
@@ -47,16 +51,16 @@ class LCV:
     def __init__(self, init_board=None):
         pass
 
-    def next_coordinate(self, board):
+    def next_coordinate(self, board, heads=None):
         """
         Sort list by amount of possible paths (ascending order)
         :param board:
         """
         cells_list = sorted(board.get_list_of_numbered_cells(),
-                            key=lambda cell: len(board.get_possible_moves(cell[0], cell[1])), reverse=False)
+                            key=lambda cell: board.count_moves(cell[0], cell[1]), reverse=False)
 
         for x, y in cells_list:
-            if not board.is_colored_cell(x, y):
+            if not board.is_colored_cell(x, y) and (heads is None or (x, y) in heads):
                 return x, y
 
 
@@ -64,12 +68,13 @@ class ByBullets:
     def __init__(self, init_board=None):
         pass
 
-    def next_coordinate(self, board):
+    def next_coordinate(self, board, heads=None):
         for i in range(3):
             for j in range(3):
                 for k in range(int(i * board.get_width() / 3), int((i + 1) * board.get_width() / 3)):
                     for l in range(int(j * board.get_height() / 3), int((j + 1) * board.get_height() / 3)):
-                        if board.is_numbered_cell(l, k) and not board.is_colored_cell(l, k):
+                        if board.is_numbered_cell(l, k) and not board.is_colored_cell(l, k) \
+                                and (heads is None or (l, k) in heads):
                             return l, k
 
 
@@ -78,14 +83,14 @@ class ByColor:
         self.list = sorted(init_board.get_list_of_numbered_cells(),
                            key=lambda cell: init_board.get_number_color_in_cell(cell[0], cell[1]))
 
-    def next_coordinate(self, board):
+    def next_coordinate(self, board, heads=None):
         """
         Sort list by amount of possible paths (descending order)
         :param board:
         :return:
         """
         for x, y in self.list:
-            if not board.is_colored_cell(x, y):
+            if not board.is_colored_cell(x, y) and (heads is None or (x, y) in heads):
                 return x, y
 
 
@@ -93,9 +98,9 @@ class RandomVariableSelection:
     def __init__(self, init_board=None):
         self.list = sample(init_board.get_list_of_numbered_cells(), len(init_board.get_list_of_numbered_cells()))
 
-    def next_coordinate(self, board):
+    def next_coordinate(self, board, heads=None):
         for x, y in self.list:
-            if not board.is_colored_cell(x, y):
+            if not board.is_colored_cell(x, y) and (heads is None or (x, y) in heads):
                 return x, y
 
 